@@ -1,181 +1,260 @@
+import os
+import threading
 import streamlit as st
 import duckdb
 import pandas as pd
 import altair as alt
 
+from collections import Counter, OrderedDict
+from datetime import date
+from functools import wraps
+from typing import Callable, Hashable
 
-db = duckdb.connect()
-db.execute(
+# Built from the processed reports by the make-qa-database stage. The
+# dashboard only reads the small summary tables, never the reports table.
+DATABASE_FILE = "data/processed/nuforc_reports.duckdb"
+
+
+@st.cache_resource(max_entries=1)
+def get_connection(
+    database_file: str, modified_time: float
+) -> duckdb.DuckDBPyConnection:
+    """ Opens the database once and reuses the connection across reruns. The
+        modified time is part of the cache key, so a rebuilt database gets a
+        new connection. Only the latest one is kept, so the old connection
+        and the replaced file are let go.
     """
-    CREATE TABLE nuforc_reports AS
-    SELECT * FROM "data/processed/nuforc_reports.csv"
+    return duckdb.connect(database_file, read_only=True)
+
+
+# The connection is shared by every session, and DuckDB connections aren't
+# safe to query from several threads at once. Each run gets its own cursor.
+db = get_connection(DATABASE_FILE, os.path.getmtime(DATABASE_FILE)).cursor()
+# The md5 of the processed reports the database was built from.
+data_version = db.query("SELECT data_version FROM build_info").fetchone()[0]
+
+# Number of query results kept across reruns and sessions.
+QUERY_CACHE_SIZE = 64
+
+
+class QueryCache:
+    """ Bounded LRU cache of query results. Shared by every session, so it's
+        locked.
     """
-)
 
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.stats = Counter(hits=0, misses=0, evictions=0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, query: Callable):
+        """ Returns the cached result for the key, running the query on a
+            miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self._entries[key]
+            self.stats["misses"] += 1
 
+        result = query()
+
+        with self._lock:
+            self._entries[key] = result
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return result
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    return QueryCache(QUERY_CACHE_SIZE)
+
+
+query_cache = get_query_cache()
+
+
+def cached_query(query_function: Callable):
+    """ Caches a query function's result on its name, arguments and the data
+        version, so a rebuilt database never serves stale results. The date
+        is part of the key too because the "recent" queries depend on the
+        current date.
+    """
+
+    @wraps(query_function)
+    def cached_query_function(*args):
+        key = (query_function.__name__, args, data_version, date.today())
+        return query_cache.get(key, lambda: query_function(*args))
+
+    return cached_query_function
+
+
+@cached_query
 def get_date_time_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            DATE_TRUNC('day', date_time) AS day,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        WHERE date_time IS NOT NULL
-        GROUP BY day
+        SELECT day, num_reports
+        FROM date_time_counts
         """
     ).fetchdf()
 
 
+@cached_query
 def get_recent_date_time_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            DATE_TRUNC('day', date_time) AS day,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        WHERE 
-            date_time IS NOT NULL AND 
-            ((CURRENT_DATE - day) < 100)
-        GROUP BY day
-    """
+        SELECT day, num_reports
+        FROM date_time_counts
+        WHERE (CURRENT_DATE - day::DATE) < 100
+        """
     ).fetchdf()
 
 
+@cached_query
 def get_posted_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            DATE_TRUNC('day', posted) AS day,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        WHERE posted IS NOT NULL
-        GROUP BY day
-    """
+        SELECT day, num_reports
+        FROM posted_counts
+        """
     ).fetchdf()
 
 
+@cached_query
 def get_recent_posted_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            DATE_TRUNC('day', posted) AS day,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        WHERE 
-            posted IS NOT NULL AND 
-            ((CURRENT_DATE - day) < 100)
-        GROUP BY day
-    """
+        SELECT day, num_reports
+        FROM posted_counts
+        WHERE (CURRENT_DATE - day::DATE) < 100
+        """
     ).fetchdf()
 
 
+@cached_query
 def get_shape_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            COALESCE(shape, 'none') AS shape,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        GROUP BY 1
+        SELECT shape, num_reports
+        FROM shape_counts
         """
     ).fetchdf()
 
 
+@cached_query
 def get_recent_shape_counts() -> pd.DataFrame:
     return db.query(
         """
         SELECT
-            COALESCE(shape, 'none') AS shape,
-            COUNT(*) AS num_reports
+            shape,
+            SUM(num_reports)::BIGINT AS num_reports
         FROM
-            nuforc_reports
-        WHERE
-            date_time IS NOT NULL AND ((current_date - date_time::DATE) < 100)
+            recent_shape_counts
+        WHERE (CURRENT_DATE - day::DATE) < 100
         GROUP BY 1
-    """
+        """
     ).fetchdf()
 
 
+@cached_query
 def get_country_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            COALESCE(country, 'none') AS country,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        GROUP BY 1
-        HAVING num_reports > 1
+        SELECT country, num_reports
+        FROM country_counts
+        WHERE num_reports > 1
         """
     ).fetchdf()
 
 
+@cached_query
 def get_recent_country_counts() -> pd.DataFrame:
     return db.query(
         """
         SELECT
-            COALESCE(country, 'none') AS country,
-            COUNT(*) AS num_reports
+            country,
+            SUM(num_reports)::BIGINT AS num_reports
         FROM
-            nuforc_reports
-        WHERE
-            date_time IS NOT NULL AND ((current_date - date_time::DATE) < 100)
+            recent_country_counts
+        WHERE (CURRENT_DATE - day::DATE) < 100
         GROUP BY 1
         HAVING num_reports > 1
         """
     ).fetchdf()
 
 
+@cached_query
 def get_state_counts() -> pd.DataFrame:
     return db.query(
         """
-        SELECT
-            COALESCE(state, 'none') AS state,
-            COUNT(*) AS num_reports
-        FROM
-            nuforc_reports
-        GROUP BY 1
-        HAVING num_reports > 1
+        SELECT state, num_reports
+        FROM state_counts
+        WHERE num_reports > 1
         """
     ).fetchdf()
 
 
+@cached_query
 def get_recent_state_counts() -> pd.DataFrame:
     return db.query(
         """
         SELECT
-            COALESCE(state, 'none') AS state,
-            COUNT(*) AS num_reports
+            state,
+            SUM(num_reports)::BIGINT AS num_reports
         FROM
-            nuforc_reports
-        WHERE
-            date_time IS NOT NULL AND ((current_date - date_time::DATE) < 100)
+            recent_state_counts
+        WHERE (CURRENT_DATE - day::DATE) < 100
         GROUP BY 1
         HAVING num_reports > 1
         """
     ).fetchdf()
 
 
-def get_geos() -> pd.DataFrame:
-    return db.query(
-        """
-        SELECT DISTINCT
-            city_latitude AS latitude,
-            city_longitude AS longitude,
-        FROM
-            nuforc_reports
-        WHERE 
-            latitude IS NOT NULL AND 
-            longitude IS NOT NULL
+# Map detail => grid cell size in degrees. Each level halves the cell.
+MAP_CELL_DEGREES = {
+    "country": 4.0,
+    "region": 2.0,
+    "state": 1.0,
+    "county": 0.5,
+    "city": 0.25,
+}
+
+
+@cached_query
+def get_geos(cell_degrees: float) -> pd.DataFrame:
+    """ Bins the report locations into a lat / lon grid and returns the
+        center and number of reports of each non empty cell, so the map gets
+        at most one point per cell however many reports there are.
+    """
+    return db.execute(
         """
+        SELECT
+            (FLOOR(latitude / $cell_degrees) + 0.5) * $cell_degrees
+                AS latitude,
+            (FLOOR(longitude / $cell_degrees) + 0.5) * $cell_degrees
+                AS longitude,
+            SUM(num_reports)::BIGINT AS num_reports
+        FROM geo_counts
+        GROUP BY 1, 2
+        """,
+        {"cell_degrees": cell_degrees},
     ).fetchdf()
 
 
+def make_geo_sizes(geos: pd.DataFrame, cell_degrees: float) -> pd.Series:
+    """ Point radius in meters for each cell, scaled so the busiest cell just
+        about fills its cell and the area tracks the number of reports.
+    """
+    max_radius = cell_degrees * 111_000 / 2
+    return max_radius * (geos.num_reports / geos.num_reports.max()) ** 0.5
+
+
 def make_date_time_counts_chart(
     date_time_counts: pd.DataFrame, title: str = "date_time counts"
 ) -> alt.Chart:
@@ -259,18 +338,27 @@ def make_state_counts_chart(
     )
 
 
-sample_frame = db.query(
-    """
-        SELECT * 
-        FROM nuforc_reports
-        WHERE posted IS NOT NULL
+@cached_query
+def get_sample_frame() -> pd.DataFrame:
+    return db.query(
+        """
+        SELECT *
+        FROM latest_reports
         ORDER BY posted DESC
-        LIMIT 100
-    """
-).to_df()
+        """
+    ).to_df()
+
 
+@cached_query
+def get_num_records() -> int:
+    # Every report is counted under exactly one shape (or "none").
+    return db.query(
+        "SELECT SUM(num_reports)::BIGINT FROM shape_counts"
+    ).fetchone()[0]
 
-num_records = db.query("SELECT COUNT(*) FROM nuforc_reports").fetchone()[0]
+
+sample_frame = get_sample_frame()
+num_records = get_num_records()
 
 date_time_counts = get_date_time_counts()
 date_time_counts_chart = make_date_time_counts_chart(date_time_counts)
@@ -307,13 +395,30 @@ recent_state_counts_chart = make_state_counts_chart(
     recent_state_counts, title="state counts (recent)"
 )
 
-geos = get_geos()
+map_detail = st.sidebar.select_slider(
+    "Map detail", options=list(MAP_CELL_DEGREES), value="state"
+)
+map_cell_degrees = MAP_CELL_DEGREES[map_detail]
+# The cached frame is shared, so add the sizes to a copy.
+geos = get_geos(map_cell_degrees)
+geos = geos.assign(size=make_geo_sizes(geos, map_cell_degrees))
 
 st.title("NUFORC PULL QA")
+st.sidebar.markdown(
+    f"""
+    ### Query cache
+    data version: `{data_version[:12]}`
+
+    {query_cache.stats["hits"]} hits, {query_cache.stats["misses"]} misses,
+    {query_cache.stats["evictions"]} evictions
+
+    {len(query_cache)} / {query_cache.maxsize} results cached
+    """
+)
 st.write(sample_frame)
 st.markdown(f"## Number of records: {num_records}")
-# Map.
-st.map(geos)
+# Map of the number of reports per grid cell.
+st.map(geos, latitude="latitude", longitude="longitude", size="size")
 # Timeline chart - date_time.
 st.altair_chart(date_time_counts_chart, use_container_width=True)
 st.altair_chart(recent_date_time_counts_chart, use_container_width=True)
@@ -0,0 +1,6 @@
+""" Offline benchmarks for the processing pipeline.
+
+    benchmarks.synthetic generates NUFORC shaped reports and GeoLite2 shaped
+    city files at any scale, benchmarks.run times each pipeline stage over
+    them.
+"""
@@ -0,0 +1,71 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BulkEndpointHandler(BaseHTTPRequestHandler):
+    """ Answers the requests load_elasticsearch.py makes the way
+        Elasticsearch would, without storing anything. Bulk requests are
+        acknowledged document by document, so the loader's client side work
+        (serializing, chunking, threading) is what gets measured.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def do_HEAD(self):
+        # No index or alias exists yet, so every load is a full load.
+        self.send_json(404, {})
+
+    def do_GET(self):
+        self.read_body()
+        index_name = self.path.strip("/").split("/")[0]
+        self.send_json(200, {index_name: {"settings": {"index": {}}}})
+
+    def do_PUT(self):
+        self.read_body()
+        self.send_json(200, {"acknowledged": True})
+
+    def do_DELETE(self):
+        self.read_body()
+        self.send_json(200, {"acknowledged": True})
+
+    def do_POST(self):
+        body = self.read_body()
+        if not self.path.split("?")[0].endswith("/_bulk"):
+            self.send_json(200, {"acknowledged": True})
+            return
+        # Every action line is followed by its document.
+        num_actions = body.count(b"\n") // 2
+        self.send_json(
+            200,
+            {
+                "took": 1,
+                "errors": False,
+                "items": [{"index": {"status": 201}}] * num_actions,
+            },
+        )
+
+
+def start_bulk_endpoint(port=0):
+    """ Starts the stand-in endpoint on a background thread and returns the
+        server. Its host:port is server.server_address.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), BulkEndpointHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,215 @@
+import click
+import json
+import os
+import subprocess
+import sys
+
+from collections import namedtuple
+from loguru import logger
+from time import perf_counter
+
+from benchmarks.bulk_endpoint import start_bulk_endpoint
+from benchmarks.synthetic import (
+    CITY_LOCATION_FILE,
+    IP_LOCATION_FILE,
+    REPORT_FILE,
+    UPDATED_REPORT_FILE,
+)
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "scripts")
+
+# The files the stages write, in the work directory.
+CITY_FILE = "cities.csv"
+MERGED_REPORT_FILE = "nuforc_reports_merged.json"
+PROCESSED_REPORT_FILE = "nuforc_reports.csv"
+
+StageResult = namedtuple(
+    "StageResult",
+    ["stage", "rows", "seconds", "rows_per_second", "peak_rss_mb"],
+)
+
+
+def count_lines(path):
+    with open(path, "rb") as lines:
+        return sum(1 for _ in lines)
+
+
+def script(name):
+    return os.path.join(SCRIPTS_DIR, name)
+
+
+def make_stages(data_dir, work_dir, es_host):
+    """ stage name => (command, input rows), in pipeline order. Later stages
+        read what the earlier ones wrote, so they need to run in this order.
+    """
+    report_path = os.path.join(data_dir, REPORT_FILE)
+    updated_report_path = os.path.join(data_dir, UPDATED_REPORT_FILE)
+    city_path = os.path.join(work_dir, CITY_FILE)
+    processed_path = os.path.join(work_dir, PROCESSED_REPORT_FILE)
+    num_reports = count_lines(report_path)
+
+    return {
+        "make_cities": (
+            [
+                sys.executable,
+                script("make_cities.py"),
+                os.path.join(data_dir, CITY_LOCATION_FILE),
+                os.path.join(data_dir, IP_LOCATION_FILE),
+                "--output-file",
+                city_path,
+            ],
+            count_lines(os.path.join(data_dir, IP_LOCATION_FILE)) - 1,
+        ),
+        "union_reports": (
+            [
+                sys.executable,
+                script("union_nuforc_reports.py"),
+                report_path,
+                updated_report_path,
+                os.path.join(work_dir, MERGED_REPORT_FILE),
+            ],
+            num_reports + count_lines(updated_report_path),
+        ),
+        "process_reports": (
+            [
+                sys.executable,
+                script("process_report_data.py"),
+                report_path,
+                city_path,
+                "--output-file",
+                processed_path,
+            ],
+            num_reports,
+        ),
+        "process_reports_vectorized": (
+            [
+                sys.executable,
+                script("process_report_data.py"),
+                report_path,
+                city_path,
+                "--output-file",
+                os.path.join(work_dir, "nuforc_reports_vectorized.csv"),
+                "--engine",
+                "vectorized",
+            ],
+            num_reports,
+        ),
+        "load_elasticsearch": (
+            [
+                sys.executable,
+                script("load_elasticsearch.py"),
+                processed_path,
+                "--host",
+                es_host,
+            ],
+            num_reports,
+        ),
+    }
+
+
+def run_command(command, log_path):
+    """ Runs the command and returns (seconds, peak RSS in MB) for it alone.
+        The output goes to the log file.
+    """
+    with open(log_path, "w") as log_file:
+        start = perf_counter()
+        process = subprocess.Popen(command, stdout=log_file, stderr=log_file)
+        # wait4 gives the resource usage of just this child.
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = perf_counter() - start
+    # Let Popen know the child has already been reaped.
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    if process.returncode != 0:
+        with open(log_path, "r") as log_file:
+            raise click.ClickException(
+                f"{' '.join(command)} failed:\n{log_file.read()[-2000:]}"
+            )
+    # ru_maxrss is in kilobytes on Linux.
+    return seconds, usage.ru_maxrss / 1024
+
+
+@click.command()
+@click.argument("data_dir", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--work-dir",
+    type=click.Path(file_okay=False, writable=True),
+    default=None,
+    help="Where the stages write their output. Defaults to DATA_DIR/work.",
+)
+@click.option(
+    "--stage",
+    "stages",
+    multiple=True,
+    help="Only run these stages (they still run in pipeline order).",
+)
+@click.option(
+    "--repeat",
+    type=click.IntRange(min=1),
+    default=3,
+    help="Runs per stage. The fastest run is reported.",
+)
+@click.option(
+    "--results-file",
+    type=click.File("w"),
+    default=None,
+    help="Write the results as JSON, for comparing runs.",
+)
+def main(data_dir, work_dir, stages, repeat, results_file):
+    """ Times each pipeline stage over the synthetic data in DATA_DIR (see
+        benchmarks.synthetic) and reports rows/sec and peak RSS. The
+        Elasticsearch load runs against a local stand-in bulk endpoint.
+    """
+    work_dir = work_dir or os.path.join(data_dir, "work")
+    os.makedirs(work_dir, exist_ok=True)
+
+    endpoint = start_bulk_endpoint()
+    es_host = "{}:{}".format(*endpoint.server_address)
+
+    all_stages = make_stages(data_dir, work_dir, es_host)
+    unknown_stages = set(stages) - set(all_stages)
+    if unknown_stages:
+        raise click.BadParameter(
+            f"Unknown stages {sorted(unknown_stages)}, expected some of "
+            f"{list(all_stages)}.",
+            param_hint="--stage",
+        )
+
+    results = []
+    for stage, (command, rows) in all_stages.items():
+        if stages and stage not in stages:
+            continue
+        runs = [
+            run_command(command, os.path.join(work_dir, f"{stage}.log"))
+            for _ in range(repeat)
+        ]
+        seconds = min(run_seconds for run_seconds, _ in runs)
+        peak_rss_mb = max(run_peak_rss_mb for _, run_peak_rss_mb in runs)
+        result = StageResult(
+            stage, rows, seconds, rows / seconds, peak_rss_mb
+        )
+        logger.info(
+            f"{stage}: {rows} rows in {seconds:.2f}s, "
+            f"{result.rows_per_second:,.0f} rows/s, "
+            f"peak RSS {peak_rss_mb:,.0f} MB."
+        )
+        results.append(result)
+
+    endpoint.shutdown()
+
+    print(
+        f"{'stage':<28} {'rows':>10} {'seconds':>9} {'rows/s':>11} "
+        f"{'peak MB':>8}"
+    )
+    for result in results:
+        print(
+            f"{result.stage:<28} {result.rows:>10} {result.seconds:>9.2f} "
+            f"{result.rows_per_second:>11,.0f} {result.peak_rss_mb:>8,.0f}"
+        )
+
+    if results_file:
+        json.dump([result._asdict() for result in results], results_file)
+
+
+if __name__ == "__main__":
+    main()
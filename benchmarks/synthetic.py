@@ -0,0 +1,457 @@
+import click
+import csv
+import json
+import os
+import random
+
+from datetime import datetime, timedelta
+from loguru import logger
+
+# File names, matching the real data where there is one.
+REPORT_FILE = "nuforc_reports.json"
+UPDATED_REPORT_FILE = "nuforc_reports_updated.json"
+CITY_LOCATION_FILE = "GeoLite2-City-Locations-en.csv"
+IP_LOCATION_FILE = "GeoLite2-City-Blocks-IPv4.csv"
+
+LOCATION_FIELDNAMES = [
+    "geoname_id",
+    "locale_code",
+    "continent_code",
+    "continent_name",
+    "country_iso_code",
+    "country_name",
+    "subdivision_1_iso_code",
+    "subdivision_1_name",
+    "subdivision_2_iso_code",
+    "subdivision_2_name",
+    "city_name",
+    "metro_code",
+    "time_zone",
+    "is_in_european_union",
+]
+
+BLOCK_FIELDNAMES = [
+    "network",
+    "geoname_id",
+    "registered_country_geoname_id",
+    "represented_country_geoname_id",
+    "is_anonymous_proxy",
+    "is_satellite_provider",
+    "postal_code",
+    "latitude",
+    "longitude",
+    "accuracy_radius",
+]
+
+# country code, country name, geoname id, [(state code, state name, lat, lon)]
+COUNTRIES = [
+    (
+        "US",
+        "United States",
+        6252001,
+        [
+            ("AL", "Alabama", 32.8, -86.8),
+            ("AK", "Alaska", 61.4, -152.3),
+            ("AZ", "Arizona", 34.2, -111.7),
+            ("AR", "Arkansas", 34.9, -92.4),
+            ("CA", "California", 36.8, -119.4),
+            ("CO", "Colorado", 39.0, -105.5),
+            ("CT", "Connecticut", 41.6, -72.7),
+            ("DE", "Delaware", 39.0, -75.5),
+            ("DC", "District of Columbia", 38.9, -77.0),
+            ("FL", "Florida", 28.6, -82.4),
+            ("GA", "Georgia", 32.7, -83.4),
+            ("HI", "Hawaii", 20.8, -156.3),
+            ("ID", "Idaho", 44.4, -114.6),
+            ("IL", "Illinois", 40.0, -89.2),
+            ("IN", "Indiana", 39.9, -86.3),
+            ("IA", "Iowa", 42.1, -93.5),
+            ("KS", "Kansas", 38.5, -98.4),
+            ("KY", "Kentucky", 37.5, -85.3),
+            ("LA", "Louisiana", 31.1, -92.0),
+            ("ME", "Maine", 45.4, -69.2),
+            ("MD", "Maryland", 39.0, -76.8),
+            ("MA", "Massachusetts", 42.3, -71.8),
+            ("MI", "Michigan", 44.3, -85.4),
+            ("MN", "Minnesota", 46.3, -94.3),
+            ("MS", "Mississippi", 32.7, -89.7),
+            ("MO", "Missouri", 38.4, -92.5),
+            ("MT", "Montana", 47.0, -109.6),
+            ("NE", "Nebraska", 41.5, -99.8),
+            ("NV", "Nevada", 39.3, -116.6),
+            ("NH", "New Hampshire", 43.7, -71.6),
+            ("NJ", "New Jersey", 40.2, -74.7),
+            ("NM", "New Mexico", 34.4, -106.1),
+            ("NY", "New York", 42.9, -75.5),
+            ("NC", "North Carolina", 35.6, -79.4),
+            ("ND", "North Dakota", 47.5, -100.5),
+            ("OH", "Ohio", 40.3, -82.8),
+            ("OK", "Oklahoma", 35.6, -97.5),
+            ("OR", "Oregon", 43.9, -120.6),
+            ("PA", "Pennsylvania", 40.9, -77.8),
+            ("RI", "Rhode Island", 41.7, -71.5),
+            ("SC", "South Carolina", 33.9, -80.9),
+            ("SD", "South Dakota", 44.4, -100.2),
+            ("TN", "Tennessee", 35.9, -86.4),
+            ("TX", "Texas", 31.5, -99.3),
+            ("UT", "Utah", 39.3, -111.7),
+            ("VT", "Vermont", 44.1, -72.7),
+            ("VA", "Virginia", 37.5, -78.9),
+            ("WA", "Washington", 47.4, -120.5),
+            ("WV", "West Virginia", 38.6, -80.6),
+            ("WI", "Wisconsin", 44.6, -89.9),
+            ("WY", "Wyoming", 43.0, -107.6),
+        ],
+    ),
+    (
+        "CA",
+        "Canada",
+        6251999,
+        [
+            ("AB", "Alberta", 53.9, -116.6),
+            ("BC", "British Columbia", 53.7, -127.6),
+            ("MB", "Manitoba", 53.8, -98.8),
+            ("NB", "New Brunswick", 46.5, -66.2),
+            ("NL", "Newfoundland and Labrador", 53.1, -57.7),
+            ("NS", "Nova Scotia", 44.7, -63.7),
+            ("ON", "Ontario", 50.0, -85.3),
+            ("PE", "Prince Edward Island", 46.5, -63.4),
+            ("QC", "Quebec", 52.9, -73.5),
+            ("SK", "Saskatchewan", 52.9, -106.5),
+            ("YT", "Yukon", 64.3, -135.0),
+        ],
+    ),
+]
+
+# The old codes the reports use for some provinces, see clean_state.
+LEGACY_STATE_CODES = {"NL": "NF", "QC": "PQ", "SK": "SA", "YT": "YK"}
+
+CITY_PREFIXES = ["", "", "", "", "", "", "Saint ", "Fort ", "Mount ", "New "]
+CITY_SYLLABLES = [
+    "ash", "bel", "bran", "bur", "car", "ches", "clay", "dal", "den", "ell",
+    "fair", "frank", "glen", "green", "ham", "har", "hill", "kings", "lake",
+    "lan", "lin", "mar", "mid", "mil", "mor", "new", "north", "oak", "pine",
+    "ral", "red", "ridge", "ros", "sal", "sher", "spring", "stan", "ton",
+    "val", "ver", "wal", "wes", "win", "wood",
+]
+CITY_SUFFIXES = [
+    "", "", "", "ton", "ville", "burg", "field", "ford", "wood", " City",
+    " Springs", " Falls", " Heights",
+]
+# Written the way the reports abbreviate them.
+REPORT_CITY_PREFIXES = {"Saint ": "St. ", "Fort ": "Ft. ", "Mount ": "Mt. "}
+
+SHAPES = [
+    "Light", "Circle", "Triangle", "Fireball", "Unknown", "Sphere", "Disk",
+    "Oval", "Other", "Formation", "Changing", "Cigar", "Flash", "Rectangle",
+    "Cylinder", "Diamond", "Chevron", "Egg", "Teardrop", "Cone", "Cross",
+    "Triangular", "Changed", "Orb", "Star",
+]
+DURATIONS = [
+    "5 minutes", "2 min", "30 seconds", "10-15 minutes", "1 hour",
+    "several minutes", "~3 min", "a few seconds", "45 mins", "unknown",
+]
+WORDS = (
+    "light lights bright sky object moving slowly fast hovering over the "
+    "a and then it was we saw my wife I looked up north south east west "
+    "red white orange green blue flashing no sound silent disappeared "
+    "triangle shaped craft above trees house car road highway minutes "
+    "seconds later another appeared formation straight line across "
+    "horizon stars plane helicopter not like anything ever seen before"
+).split()
+
+FIRST_DATE = datetime(1950, 1, 1)
+LAST_DATE = datetime(2023, 12, 31)
+
+
+def make_city_name(rng):
+    name = "".join(
+        rng.choice(CITY_SYLLABLES) for _ in range(rng.randint(1, 2))
+    )
+    return (
+        rng.choice(CITY_PREFIXES)
+        + name.capitalize()
+        + rng.choice(CITY_SUFFIXES)
+    )
+
+
+def make_cities(num_cities, seed):
+    """ Generates (geoname id, country, state, city name, lat, lon) for the
+        cities, spread across the states.
+    """
+    rng = random.Random(seed)
+    states = [
+        (country, state)
+        for country in COUNTRIES
+        for state in country[3]
+    ]
+    cities = []
+    seen = set()
+    geoname_id = 100000
+    while len(cities) < num_cities:
+        country, (state_code, _, state_lat, state_lon) = rng.choice(states)
+        city_name = make_city_name(rng)
+        # City names are unique within a state, like the real ones mostly are.
+        if (state_code, city_name) in seen:
+            continue
+        seen.add((state_code, city_name))
+        geoname_id += 1
+        cities.append(
+            (
+                geoname_id,
+                country,
+                state_code,
+                city_name,
+                round(state_lat + rng.uniform(-2.5, 2.5), 4),
+                round(state_lon + rng.uniform(-3.5, 3.5), 4),
+            )
+        )
+    return cities
+
+
+def write_city_files(cities, output_dir, blocks_per_city, seed):
+    """ Writes the GeoLite2 city locations and IPv4 blocks CSVs. Every city
+        gets a handful of blocks scattered around its center, plus a few
+        locations without a city the way the real file has them.
+    """
+    rng = random.Random(seed)
+    num_blocks = 0
+    with open(
+        os.path.join(output_dir, CITY_LOCATION_FILE), "w", newline=""
+    ) as location_file, open(
+        os.path.join(output_dir, IP_LOCATION_FILE), "w", newline=""
+    ) as block_file:
+        locations = csv.DictWriter(
+            location_file, fieldnames=LOCATION_FIELDNAMES
+        )
+        blocks = csv.DictWriter(block_file, fieldnames=BLOCK_FIELDNAMES)
+        locations.writeheader()
+        blocks.writeheader()
+
+        state_names = {
+            state_code: state_name
+            for country in COUNTRIES
+            for state_code, state_name, _, _ in country[3]
+        }
+
+        for geoname_id, country, state_code, city_name, lat, lon in cities:
+            country_code, country_name, country_geoname_id, _ = country
+            locations.writerow(
+                {
+                    "geoname_id": geoname_id,
+                    "locale_code": "en",
+                    "continent_code": "NA",
+                    "continent_name": "North America",
+                    "country_iso_code": country_code,
+                    "country_name": country_name,
+                    "subdivision_1_iso_code": state_code,
+                    "subdivision_1_name": state_names[state_code],
+                    "subdivision_2_iso_code": "",
+                    "subdivision_2_name": "",
+                    # Region level locations have no city.
+                    "city_name": city_name if rng.random() > 0.01 else "",
+                    "metro_code": "",
+                    "time_zone": "America/Chicago",
+                    "is_in_european_union": 0,
+                }
+            )
+            for _ in range(max(1, int(rng.expovariate(1 / blocks_per_city)))):
+                blocks.writerow(
+                    {
+                        "network":
+                            f"{1 + num_blocks // 65536 % 223}."
+                            f"{num_blocks // 256 % 256}."
+                            f"{num_blocks % 256}.0/24",
+                        "geoname_id": geoname_id,
+                        "registered_country_geoname_id": country_geoname_id,
+                        "represented_country_geoname_id": "",
+                        "is_anonymous_proxy": 0,
+                        "is_satellite_provider": 0,
+                        "postal_code": f"{rng.randint(10000, 99999)}",
+                        "latitude": round(lat + rng.gauss(0, 0.05), 4),
+                        "longitude": round(lon + rng.gauss(0, 0.05), 4),
+                        "accuracy_radius": rng.choice([5, 10, 20, 50, 100]),
+                    }
+                )
+                num_blocks += 1
+
+    return num_blocks
+
+
+def make_report_city(rng, city_name):
+    """ Writes the city the messy way the reports do: abbreviated prefixes,
+        parenthetical notes and alternate names after a slash.
+    """
+    for prefix, abbreviation in REPORT_CITY_PREFIXES.items():
+        if city_name.startswith(prefix) and rng.random() < 0.6:
+            city_name = abbreviation + city_name[len(prefix):]
+    roll = rng.random()
+    if roll < 0.08:
+        city_name += f" ({rng.choice(['near', 'outside', 'north of'])} town)"
+    elif roll < 0.1:
+        city_name += f"/{make_city_name(rng)}"
+    elif roll < 0.12:
+        city_name = city_name.lower()
+    return city_name
+
+
+def make_report(report_id, cities, city_weights, seed, revision=0):
+    """ Generates a raw report as the spider scrapes it. The same id, seed and
+        revision always give the same report.
+    """
+    rng = random.Random(seed * 1_000_003 + report_id * 7 + revision)
+
+    (_, country, state_code, city_name, _, _), = rng.choices(
+        cities, cum_weights=city_weights
+    )
+    roll = rng.random()
+    if roll < 0.05:
+        # Somewhere that isn't in the city data.
+        city = make_city_name(rng)
+    elif roll < 0.07:
+        city = rng.choice(["Unknown", "rural", "In flight", "At sea"])
+    else:
+        city = make_report_city(rng, city_name)
+
+    state = LEGACY_STATE_CODES.get(state_code, state_code) \
+        if rng.random() < 0.3 else state_code
+    if rng.random() < 0.03:
+        state = state.lower()
+    if rng.random() < 0.02:
+        state = ""
+
+    occurred = FIRST_DATE + timedelta(
+        seconds=rng.randint(0, int((LAST_DATE - FIRST_DATE).total_seconds()))
+    )
+    posted = min(occurred + timedelta(days=rng.randint(0, 400)), LAST_DATE)
+    if rng.random() < 0.05:
+        date_time = occurred.strftime("%-m/%-d/%y")
+    elif rng.random() < 0.01:
+        date_time = ""
+    else:
+        date_time = occurred.strftime("%-m/%-d/%y %H:%M")
+
+    shape = rng.choice(SHAPES) if rng.random() > 0.03 else ""
+    if shape and rng.random() < 0.1:
+        shape = shape.upper()
+
+    words = rng.choices(WORDS, k=int(rng.lognormvariate(4.3, 0.7)) + 5)
+    text = " ".join(words).capitalize() + "."
+    duration = rng.choice(DURATIONS)
+
+    return {
+        "text": text,
+        "stats":
+            f"Occurred : {date_time}|Reported: {posted:%-m/%-d/%Y}|"
+            f"Posted: {posted:%-m/%-d/%Y}|Location: {city}, {state}|"
+            f"Shape: {shape}|Duration:{duration}",
+        "date_time": date_time,
+        "report_link":
+            f"http://www.nuforc.org/webreports/{report_id // 1000:03d}/"
+            f"S{report_id}.html",
+        "city": city,
+        "state": state,
+        "country": "USA" if country[0] == "US" else country[1],
+        "shape": shape,
+        "duration": duration,
+        "summary": " ".join(words[:20]),
+        "posted": posted.strftime("%-m/%-d/%y"),
+    }
+
+
+def city_cumulative_weights(cities):
+    """ A few big cities get most of the reports, like the real data. """
+    weights = []
+    total = 0.0
+    for rank in range(len(cities)):
+        total += 1.0 / (rank + 1) ** 0.9
+        weights.append(total)
+    return weights
+
+
+def write_reports(path, report_ids, cities, seed, revision_of=None):
+    """ Writes the reports for the ids as line delimited JSON. revision_of
+        picks the ids that get a changed copy of their report.
+    """
+    city_weights = city_cumulative_weights(cities)
+    num_reports = 0
+    with open(path, "w") as report_file:
+        for report_id in report_ids:
+            revision = 1 if revision_of and revision_of(report_id) else 0
+            report = make_report(
+                report_id, cities, city_weights, seed, revision
+            )
+            report_file.write(json.dumps(report) + "\n")
+            num_reports += 1
+    return num_reports
+
+
+@click.command()
+@click.argument("output_dir", type=click.Path(file_okay=False, writable=True))
+@click.option(
+    "--reports",
+    "-n",
+    "num_reports",
+    type=click.IntRange(min=1),
+    default=10_000,
+    help="Number of reports, e.g. 10000 up to 10000000.",
+)
+@click.option(
+    "--cities",
+    "num_cities",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of cities. Defaults to a fifth of the reports.",
+)
+@click.option(
+    "--blocks-per-city",
+    type=click.FloatRange(min=1.0),
+    default=5.0,
+    help="Mean number of IPv4 blocks per city.",
+)
+@click.option(
+    "--update-fraction",
+    type=click.FloatRange(min=0.0, max=1.0),
+    default=0.1,
+    help=(
+        "The updated report file has this fraction of the reports changed "
+        "and as many new ones."
+    ),
+)
+@click.option("--seed", type=int, default=0)
+def main(
+    output_dir, num_reports, num_cities, blocks_per_city, update_fraction, seed
+):
+    """ Generates synthetic NUFORC shaped raw reports (plus an updated pull
+        for the merge) and GeoLite2 shaped city files in OUTPUT_DIR. The
+        output only depends on the options, so benchmark runs are repeatable.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    num_cities = num_cities or max(100, num_reports // 5)
+
+    logger.info(f"Generating {num_cities} cities.")
+    cities = make_cities(num_cities, seed)
+    num_blocks = write_city_files(cities, output_dir, blocks_per_city, seed)
+    logger.info(f"Wrote {num_cities} city locations and {num_blocks} blocks.")
+
+    logger.info(f"Generating {num_reports} reports.")
+    write_reports(
+        os.path.join(output_dir, REPORT_FILE), range(num_reports), cities, seed
+    )
+
+    # The updated pull repeats the newest reports, some of them changed, and
+    # adds new ones, like a nightly scrape.
+    num_updated = int(num_reports * update_fraction)
+    num_written = write_reports(
+        os.path.join(output_dir, UPDATED_REPORT_FILE),
+        range(num_reports - num_updated, num_reports + num_updated),
+        cities,
+        seed,
+        revision_of=lambda report_id: report_id < num_reports,
+    )
+    logger.info(f"Wrote {num_written} updated reports.")
+    logger.info(" 🛸 Done 🛸 ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Times the report page parsing over saved report pages, comparing the
+# single pass parse_report_area with the original XPath based extraction.
+#
+#     cd nuforc_reports
+#     python benchmark_report_parse.py ../tests/data/report_pages/*.html
+
+import click
+
+from scrapy.http import HtmlResponse
+from time import perf_counter
+
+from nuforc_reports.spiders.nuforc_report_spider import (
+    REPORT_AREA_XPATH,
+    parse_report_area,
+)
+
+
+def parse_report_area_xpath(response):
+    """ The original extraction, which evaluates the report area XPaths five
+        times per page.
+    """
+    labels_xpath = REPORT_AREA_XPATH + '//b/text()'
+    texts_xpath = REPORT_AREA_XPATH + '/text()'
+
+    report_area = response.xpath(REPORT_AREA_XPATH)
+    report_zip = zip(
+        [x.split(":")[0] for x in report_area.xpath(labels_xpath).getall()],
+        [x for x in
+         [x.strip() for x in report_area.xpath(texts_xpath).getall()]
+         if x != ''],
+    )
+    report_data = {
+        k: v for k, v in zip(
+            [x.split(":")[0]
+             for x in report_area.xpath(labels_xpath).getall()],
+            [x for x in
+             [x.strip() for x in report_area.xpath(texts_xpath).getall()]
+             if x != ''],
+        )
+    }
+    report_text = " ".join(
+        [x.strip() for x in report_area.xpath(texts_xpath).getall()][9:]
+    )
+    return list(report_zip), report_text, report_data
+
+
+def time_parser(parser, pages, repeat):
+    """ Returns the mean seconds per page. Each page gets a fresh response so
+        the parsed document isn't cached between runs.
+    """
+    start = perf_counter()
+    for _ in range(repeat):
+        for url, body in pages:
+            parser(HtmlResponse(url=url, body=body, encoding='utf-8'))
+    return (perf_counter() - start) / (repeat * len(pages))
+
+
+@click.command()
+@click.argument('page_files', type=click.File('rb'), nargs=-1, required=True)
+@click.option('--repeat', '-r', type=int, default=5)
+def main(page_files, repeat):
+    pages = [
+        (f'file://{page_file.name}', page_file.read())
+        for page_file in page_files
+    ]
+
+    # Both have to give the same answer before the timings mean anything.
+    for url, body in pages:
+        response = HtmlResponse(url=url, body=body, encoding='utf-8')
+        report_pairs, report_text = parse_report_area(response)
+        xpath_pairs, xpath_text, _ = parse_report_area_xpath(response)
+        if (report_pairs, report_text) != (xpath_pairs, xpath_text):
+            raise click.ClickException(f'Parsers disagree on {url}.')
+
+    xpath_time = time_parser(parse_report_area_xpath, pages, repeat)
+    single_pass_time = time_parser(parse_report_area, pages, repeat)
+
+    print(f'{len(pages)} pages x {repeat}')
+    print(f'xpath:       {xpath_time * 1e6:8.1f} us/page')
+    print(f'single pass: {single_pass_time * 1e6:8.1f} us/page')
+    print(f'speedup:     {xpath_time / single_pass_time:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
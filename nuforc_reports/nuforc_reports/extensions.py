@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from twisted.internet import task
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(sorted_values, fraction):
+    """ Nearest rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[rank]
+
+
+class ThroughputStats:
+    """ Logs the pages per minute and the download latency percentiles for
+        every interval, so crawl tuning can be checked against sustained
+        throughput. The overall figures are added to the crawl stats when the
+        spider closes.
+    """
+
+    def __init__(self, stats, interval=60.0):
+        self.stats = stats
+        self.interval = interval
+        self.task = None
+        self.start_time = None
+        # Latencies of the downloads in the current interval, and all of them.
+        self.interval_latencies = []
+        self.latencies = []
+        self.throttled = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        interval = crawler.settings.getfloat('THROUGHPUT_LOG_INTERVAL')
+        if not interval:
+            raise NotConfigured
+        o = cls(crawler.stats, interval)
+        crawler.signals.connect(o.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(
+            o.response_received, signal=signals.response_received
+        )
+        return o
+
+    def spider_opened(self, spider):
+        self.start_time = time.monotonic()
+        self.task = task.LoopingCall(self.log, spider)
+        self.task.start(self.interval, now=False)
+
+    def response_received(self, response, request, spider):
+        # Cached responses never hit the network.
+        if 'cached' in response.flags:
+            return
+        latency = request.meta.get('download_latency')
+        if latency is not None:
+            self.interval_latencies.append(latency)
+        if response.status in (429, 503):
+            self.throttled += 1
+
+    def log(self, spider):
+        latencies = sorted(self.interval_latencies)
+        self.latencies.extend(latencies)
+        self.interval_latencies = []
+
+        logger.info(
+            'Downloaded %(pagerate).1f pages/min, latency p50 %(p50).3fs '
+            'p90 %(p90).3fs p99 %(p99).3fs, %(throttled)d throttled '
+            'responses so far',
+            {
+                'pagerate': len(latencies) * 60.0 / self.interval,
+                'p50': percentile(latencies, 0.5),
+                'p90': percentile(latencies, 0.9),
+                'p99': percentile(latencies, 0.99),
+                'throttled': self.throttled,
+            },
+            extra={'spider': spider},
+        )
+
+    def spider_closed(self, spider, reason):
+        if self.task and self.task.running:
+            self.task.stop()
+
+        latencies = sorted(self.latencies + self.interval_latencies)
+        elapsed = time.monotonic() - self.start_time
+        self.stats.set_value(
+            'throughput/pages_per_minute',
+            round(len(latencies) * 60.0 / elapsed, 1) if elapsed else 0.0,
+            spider=spider,
+        )
+        for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]:
+            self.stats.set_value(
+                f'throughput/latency_{name}',
+                round(percentile(latencies, fraction), 3),
+                spider=spider,
+            )
+        self.stats.set_value(
+            'throughput/throttled_responses', self.throttled, spider=spider
+        )
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from email.utils import parsedate_to_datetime
+
+from scrapy import signals
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.exceptions import NotConfigured
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_MODES = ('record', 'replay')
+
+
+class RecordPolicy(DummyPolicy):
+    """ Always downloads and stores the fresh page, never serves the cache.
+    """
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return False
+
+
+class ReportPagePolicy(DummyPolicy):
+    """ Caches the report pages for good but never the listing pages (the
+        start page and the date index pages), which change as new reports are
+        posted. Listing requests are marked with the listing_page meta key.
+    """
+
+    def should_cache_request(self, request):
+        if request.meta.get('listing_page'):
+            return False
+        return super(ReportPagePolicy, self).should_cache_request(request)
+
+
+class PageCacheMiddleware(HttpCacheMiddleware):
+    """ Records the fetched index and report pages to a gzipped cache on disk,
+        or replays a crawl from that cache without touching the network.
+
+        Set PAGE_CACHE_MODE to "record" or "replay" (it's off otherwise). In
+        record mode every page is downloaded and stored, apart from the
+        responses that get retried and 304s. In replay mode pages are served
+        from the cache and pages that aren't in it are dropped.
+        The cache lives in PAGE_CACHE_DIR, keyed by the request fingerprint
+        (i.e. the URL).
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        mode = crawler.settings.get('PAGE_CACHE_MODE')
+        if not mode:
+            raise NotConfigured
+        if mode not in PAGE_CACHE_MODES:
+            raise ValueError(
+                f'PAGE_CACHE_MODE must be one of {PAGE_CACHE_MODES}, '
+                f'not {mode!r}.'
+            )
+
+        # The crawler settings are frozen, so configure a copy.
+        settings = Settings(crawler.settings.copy_to_dict())
+        settings.set('HTTPCACHE_ENABLED', True)
+        settings.set('HTTPCACHE_DIR', crawler.settings.get('PAGE_CACHE_DIR'))
+        settings.set('HTTPCACHE_GZIP', True)
+        settings.set('HTTPCACHE_EXPIRATION_SECS', 0)
+        settings.set(
+            'HTTPCACHE_STORAGE',
+            'scrapy.extensions.httpcache.FilesystemCacheStorage'
+        )
+        settings.set(
+            'HTTPCACHE_POLICY',
+            'nuforc_reports.middlewares.RecordPolicy'
+            if mode == 'record'
+            else 'scrapy.extensions.httpcache.DummyPolicy'
+        )
+        settings.set('HTTPCACHE_IGNORE_MISSING', mode == 'replay')
+        # A throttled or failed response would be replayed in place of the
+        # page, and a 304 has no page at all.
+        settings.set(
+            'HTTPCACHE_IGNORE_HTTP_CODES',
+            sorted(
+                set(map(int, crawler.settings.getlist('RETRY_HTTP_CODES')))
+                | {304}
+            )
+        )
+
+        middleware = cls(settings, crawler.stats)
+        crawler.signals.connect(
+            middleware.spider_opened, signal=signals.spider_opened
+        )
+        crawler.signals.connect(
+            middleware.spider_closed, signal=signals.spider_closed
+        )
+        return middleware
+
+
+def retry_after_seconds(response):
+    """ The delay asked for by the response's Retry-After header, in seconds,
+        or None if it doesn't have a valid one. It can be a number of seconds
+        or an HTTP date.
+    """
+    retry_after = response.headers.get('Retry-After')
+    if not retry_after:
+        return None
+    retry_after = retry_after.decode('latin-1').strip()
+    if retry_after.isdigit():
+        return float(retry_after)
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class BackoffMiddleware:
+    """ Backs off a site that's throttling or failing. When a response has
+        one of the RETRY_HTTP_CODES, the download delay of the site's slot is
+        raised to the response's Retry-After, or doubled if it doesn't have
+        one, starting at RETRY_BACKOFF_BASE_DELAY and capped at
+        RETRY_BACKOFF_MAX_DELAY. With AutoThrottle on the delay eases off
+        again as successful responses come in.
+
+        Sits just after the RetryMiddleware, which retries the request. Off
+        unless RETRY_BACKOFF_ENABLED is set.
+    """
+
+    def __init__(self, crawler, retry_http_codes, base_delay, max_delay):
+        self.crawler = crawler
+        self.retry_http_codes = retry_http_codes
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RETRY_BACKOFF_ENABLED'):
+            raise NotConfigured
+        return cls(
+            crawler,
+            set(map(int, settings.getlist('RETRY_HTTP_CODES'))),
+            settings.getfloat('RETRY_BACKOFF_BASE_DELAY'),
+            settings.getfloat('RETRY_BACKOFF_MAX_DELAY'),
+        )
+
+    def process_response(self, request, response, spider):
+        if response.status not in self.retry_http_codes:
+            return response
+        slot = self.crawler.engine.downloader.slots.get(
+            request.meta.get('download_slot')
+        )
+        if slot is None:
+            return response
+
+        delay = retry_after_seconds(response)
+        if delay is None:
+            delay = max(slot.delay * 2, self.base_delay)
+        delay = min(delay, self.max_delay)
+        if delay > slot.delay:
+            logger.info(
+                'Got %(status)d from %(url)s, backing off to a %(delay).1fs '
+                'download delay',
+                {'status': response.status, 'url': response.url,
+                 'delay': delay},
+                extra={'spider': spider},
+            )
+            slot.delay = delay
+        return response
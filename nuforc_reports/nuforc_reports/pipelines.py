@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import importlib
+import os
+import sys
+from csv import DictWriter
+
+from scrapy.exceptions import NotConfigured
+
+# The cleaning and geocoding code lives with the DVC scripts.
+DEFAULT_SCRIPTS_DIR = os.path.join(
+    os.path.dirname(__file__), os.pardir, os.pardir, 'scripts'
+)
+
+
+def import_report_processing(scripts_dir):
+    """ Imports process_report_data from the scripts directory.
+    """
+    scripts_dir = os.path.abspath(scripts_dir)
+    if scripts_dir not in sys.path:
+        sys.path.insert(0, scripts_dir)
+    return importlib.import_module('process_report_data')
+
+
+class ProcessedReportPipeline:
+    """ Cleans and geocodes the reports as they're scraped and appends them to
+        a processed report CSV, so new reports can be queried without waiting
+        for the geocode-reports stage. The items themselves are passed on
+        untouched, so the raw feed is still written.
+
+        Off unless PROCESSED_REPORTS_FILE and PROCESSED_CITY_PATH (the city
+        CSV or geocoder index directory) are set. The rows are the same as the
+        ones process_report_data.py writes for the same reports. The file
+        must not be that script's incremental output, which is rebuilt from
+        scratch when its size doesn't match the last run.
+    """
+
+    def __init__(self, output_path, city_path, city_cache_size,
+                 fuzzy_threshold, scripts_dir, stats):
+        self.output_path = output_path
+        self.city_path = city_path
+        self.city_cache_size = city_cache_size
+        self.fuzzy_threshold = fuzzy_threshold
+        self.scripts_dir = scripts_dir
+        self.stats = stats
+        self.processing = None
+        self.city_cache = None
+        self.output_file = None
+        self.writer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        output_path = settings.get('PROCESSED_REPORTS_FILE')
+        city_path = settings.get('PROCESSED_CITY_PATH')
+        if not output_path or not city_path:
+            raise NotConfigured
+        fuzzy_threshold = settings.get('PROCESSED_FUZZY_THRESHOLD')
+        return cls(
+            output_path,
+            city_path,
+            settings.getint('PROCESSED_CITY_CACHE_SIZE', 50000),
+            float(fuzzy_threshold) if fuzzy_threshold is not None else None,
+            settings.get('NUFORC_SCRIPTS_DIR') or DEFAULT_SCRIPTS_DIR,
+            crawler.stats,
+        )
+
+    def open_spider(self, spider):
+        self.processing = import_report_processing(self.scripts_dir)
+        fuzzy_matcher = \
+            self.processing.fuzzy_geocoder.FuzzyMatcher(
+                self.processing.load_city_locations(self.city_path),
+                self.fuzzy_threshold
+            ) if self.fuzzy_threshold is not None else None
+        self.city_cache = self.processing.CityCache(
+            self.processing.load_geocoder(self.city_path),
+            self.city_cache_size,
+            fuzzy_matcher,
+        )
+
+        # Appends to an existing processed file, which already has a header.
+        write_header = \
+            not os.path.exists(self.output_path) \
+            or os.path.getsize(self.output_path) == 0
+        self.output_file = open(self.output_path, 'a')
+        self.writer = DictWriter(
+            self.output_file, fieldnames=self.processing.FIELDNAMES
+        )
+        if write_header:
+            self.writer.writeheader()
+
+    def process_item(self, item, spider):
+        # process_report works in place, so give it a copy.
+        report = self.processing.process_report(dict(item), self.city_cache)
+        self.writer.writerow(report)
+        self.stats.inc_value('nuforc/processed_reports', spider=spider)
+        return item
+
+    def close_spider(self, spider):
+        if self.output_file is not None:
+            self.output_file.close()
+        if self.city_cache is not None:
+            self.city_cache.log_stats()
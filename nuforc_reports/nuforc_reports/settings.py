@@ -52,21 +52,85 @@ DOWNLOAD_DELAY = 0.01
 
 # Enable or disable downloader middlewares
 # See http://scrapy.readthedocs.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    'nuforc_reports.middlewares.MyCustomDownloaderMiddleware': 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    'nuforc_reports.middlewares.BackoffMiddleware': 560,
+    'nuforc_reports.middlewares.PageCacheMiddleware': 900,
+}
+
+# Raise the download delay on throttled or failed responses (RETRY_HTTP_CODES),
+# to the Retry-After if there is one or else doubling it, within these bounds.
+RETRY_BACKOFF_ENABLED = False
+RETRY_BACKOFF_BASE_DELAY = 1.0
+RETRY_BACKOFF_MAX_DELAY = 60.0
+
+# Record the fetched pages to a local gzipped cache, or replay a crawl from it
+# with no network access: scrapy crawl nuforc_report_spider -s PAGE_CACHE_MODE=replay
+# Off unless set to "record" or "replay". The directory is relative to the
+# project's .scrapy directory.
+PAGE_CACHE_MODE = None
+PAGE_CACHE_DIR = 'page_cache'
 
 # Enable or disable extensions
 # See http://scrapy.readthedocs.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    'scrapy.extensions.telnet.TelnetConsole': None,
-#}
+EXTENSIONS = {
+    'nuforc_reports.extensions.ThroughputStats': 500,
+}
+
+# Log the pages/min and download latency percentiles every this many seconds.
+# Set to 0 to turn it off.
+THROUGHPUT_LOG_INTERVAL = 60
+
+# Named groups of settings, picked with CRAWL_PROFILE:
+#     scrapy crawl nuforc_report_spider -s CRAWL_PROFILE=backfill
+# A profile overrides the defaults in this file, settings given with -s on the
+# command line still win.
+CRAWL_PROFILE = None
+CRAWL_PROFILES = {
+    # Full historical backfills: high concurrency kept polite by AutoThrottle,
+    # retries with backoff on throttling and a cache of the report pages so
+    # an interrupted backfill resumes from disk. The listing pages and the
+    # retried responses aren't cached.
+    'backfill': {
+        'CONCURRENT_REQUESTS': 32,
+        'CONCURRENT_REQUESTS_PER_DOMAIN': 8,
+        'DOWNLOAD_DELAY': 0,
+        'DOWNLOAD_TIMEOUT': 60,
+        'AUTOTHROTTLE_ENABLED': True,
+        'AUTOTHROTTLE_START_DELAY': 0.25,
+        'AUTOTHROTTLE_MAX_DELAY': 10,
+        'AUTOTHROTTLE_TARGET_CONCURRENCY': 4.0,
+        'RETRY_TIMES': 5,
+        'RETRY_HTTP_CODES': [429, 500, 502, 503, 504, 522, 524, 408],
+        'RETRY_BACKOFF_ENABLED': True,
+        'DNSCACHE_ENABLED': True,
+        'DNSCACHE_SIZE': 1000,
+        'DNS_TIMEOUT': 20,
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': 'backfill_cache',
+        'HTTPCACHE_GZIP': True,
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        'HTTPCACHE_IGNORE_HTTP_CODES':
+            [304, 408, 429, 500, 502, 503, 504, 522, 524],
+        'HTTPCACHE_POLICY': 'nuforc_reports.middlewares.ReportPagePolicy',
+        'HTTPCACHE_STORAGE':
+            'scrapy.extensions.httpcache.FilesystemCacheStorage',
+    },
+}
 
 # Configure item pipelines
 # See http://scrapy.readthedocs.org/en/latest/topics/item-pipeline.html
-#ITEM_PIPELINES = {
-#    'nuforc_reports.pipelines.NuforcReportsPipeline': 300,
-#}
+ITEM_PIPELINES = {
+    'nuforc_reports.pipelines.ProcessedReportPipeline': 300,
+}
+
+# Clean and geocode the reports as they're scraped and append them to this
+# CSV. Off unless both the file and the city CSV / geocoder index are set.
+# Keep it apart from the geocode-reports output, an incremental run rebuilds
+# that from scratch if anything else has written to it.
+PROCESSED_REPORTS_FILE = None
+PROCESSED_CITY_PATH = None
+PROCESSED_CITY_CACHE_SIZE = 50000
+PROCESSED_FUZZY_THRESHOLD = None
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See http://doc.scrapy.org/en/latest/topics/autothrottle.html
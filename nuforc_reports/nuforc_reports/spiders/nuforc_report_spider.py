@@ -1,21 +1,173 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
 import scrapy
 from datetime import datetime
 
+
+def load_seen_reports(known_reports=None):
+    """ Loads the set of report links that have already been stored. Known
+        reports can be a report store index (JSON keyed by link) or line
+        delimited JSON reports. The index is only written once the scraped
+        reports are in the store, so a crawl whose reports never got there
+        requests them again.
+    """
+    seen_reports = set()
+
+    if known_reports and os.path.exists(known_reports):
+        with open(known_reports, 'r') as known_reports_file:
+            for line in known_reports_file:
+                record = json.loads(line)
+                # A line delimited report, or the whole report store index.
+                if 'report_link' in record:
+                    seen_reports.add(record['report_link'])
+                else:
+                    seen_reports.update(record.keys())
+
+    seen_reports.discard('')
+    return seen_reports
+
+
+def load_index_validators(index_state=None):
+    """ Loads the validators of the date index pages from the last crawl, a
+        JSON object of index page URL => {etag, last_modified, content_hash}.
+    """
+    if not index_state or not os.path.exists(index_state):
+        return {}
+    with open(index_state, 'r') as index_state_file:
+        return json.load(index_state_file)
+
+
+def pending_index_state(index_state):
+    """ Where a crawl leaves its validators. The report store promotes them to
+        the index state once the crawl's reports are stored.
+    """
+    return index_state + '.pending'
+
+
+def save_index_validators(index_state, index_validators):
+    with open(index_state + '.tmp', 'w') as index_state_file:
+        json.dump(index_validators, index_state_file, indent=1, sort_keys=True)
+    os.replace(index_state + '.tmp', index_state)
+
+
+def content_hash(body):
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def conditional_headers(validators):
+    """ The conditional request headers for an index page's validators.
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+# The report is not a table anymore, it's the text of this div with the
+# labels in bold.
+REPORT_AREA_XPATH = '//div[contains(@class, "content-area clr")]'
+
+
+def parse_report_area(response):
+    """ Extracts the (label, value) pairs and the narrative text from a report
+        page in a single walk over the report area elements.
+
+        The direct text nodes of the report area are the label values followed
+        by the narrative. The bold text nodes are the labels.
+    """
+    labels = []
+    texts = []
+
+    for report_area in response.xpath(REPORT_AREA_XPATH):
+        root = report_area.root
+        if root.text:
+            texts.append(root.text)
+        for child in root:
+            for bold in child.iter('b'):
+                if bold.text:
+                    labels.append(bold.text)
+                for bold_child in bold:
+                    if bold_child.tail:
+                        labels.append(bold_child.tail)
+            if child.tail:
+                texts.append(child.tail)
+
+    stripped_texts = [x.strip() for x in texts]
+
+    # The first row is a rehash (sort of) of the table summary.
+    # Included for completeness.
+    report_pairs = list(zip(
+        [x.split(":")[0] for x in labels],
+        [x for x in stripped_texts if x != '']
+    ))
+    report_text = " ".join(stripped_texts[9:])
+
+    return report_pairs, report_text
+
+
 class NuforcReportSpider(scrapy.Spider):
     name = 'nuforc_report_spider'
     allowed_domains = ['www.nuforc.org', 'nuforc.org']
     start_urls = ['https://www.nuforc.org/ndx/?id=post']
 
-    def __init__(self, start_date=None, stop_date=None, *args, **kwargs):
+    def __init__(self, start_date=None, stop_date=None, known_reports=None,
+                 index_state=None, *args, **kwargs):
         self.start_date = \
             datetime.strptime(start_date, '%m/%d/%Y') \
             if start_date else None
         self.stop_date = \
             datetime.strptime(stop_date, '%m/%d/%Y') \
             if stop_date else None
+        # Reports that are already in the store are skipped.
+        self.seen_reports = load_seen_reports(known_reports)
+        # Date index pages that haven't changed since the last crawl aren't
+        # parsed again. The validators are left pending when the spider
+        # closes.
+        self.index_state = index_state
+        self.index_validators = load_index_validators(index_state)
+        self.previous_index_validators = dict(self.index_validators)
         super(NuforcReportSpider, self).__init__(*args, **kwargs)
 
+    @classmethod
+    def update_settings(cls, settings):
+        super(NuforcReportSpider, cls).update_settings(settings)
+        # Apply the CRAWL_PROFILE at spider priority, so the profile overrides
+        # the project settings but not the ones given on the command line.
+        profile = settings.get('CRAWL_PROFILE')
+        if profile:
+            profiles = settings.getdict('CRAWL_PROFILES')
+            if profile not in profiles:
+                raise ValueError(
+                    f'Unknown CRAWL_PROFILE {profile!r}, expected one of '
+                    f'{sorted(profiles)}.'
+                )
+            settings.setdict(profiles[profile], priority='spider')
+
+    def closed(self, reason):
+        # The new validators are only kept from a finished crawl. If the
+        # crawl was cut short some of the reports on a changed index page
+        # might not have been requested, so it has to be parsed again next
+        # time. Either way they're only pending: until the scraped reports
+        # are stored (report_store.py append --index-state) the next crawl
+        # still checks against the old ones.
+        if self.index_state:
+            save_index_validators(
+                pending_index_state(self.index_state),
+                self.index_validators if reason == 'finished'
+                else self.previous_index_validators
+            )
+
+    def start_requests(self):
+        # The listing pages are marked so the backfill cache skips them.
+        for url in self.start_urls:
+            yield scrapy.Request(
+                url, dont_filter=True, meta={'listing_page': True}
+            )
+
     def parse(self, response):
         
         table_links = response.xpath('//tr/td/u/a')
@@ -37,12 +189,64 @@ class NuforcReportSpider(scrapy.Spider):
 
             # If link date is greater than or equal to the stop date, skip.
             if self.stop_date and (link_date >= self.stop_date): continue
-            url = tl.xpath("@href").get()
+            url = 'https://nuforc.org' + tl.xpath("@href").get()
+
+            # Ask for the index page only if it changed since the last crawl.
+            yield response.follow(
+                url,
+                self.parse_date_index,
+                headers=conditional_headers(
+                    self.index_validators.get(url, {})
+                ) if self.skips_unchanged_index_pages() else {},
+                meta={
+                    'index_url': url,
+                    'listing_page': True,
+                    'handle_httpstatus_list': [304],
+                },
+            )
 
-            yield response.follow('https://nuforc.org' + url, self.parse_date_index)
+    def skips_unchanged_index_pages(self):
+        """ Whether index pages are checked against their validators. Not
+            when recording or replaying the page cache, which needs every
+            index page in full.
+        """
+        return not self.settings.get('PAGE_CACHE_MODE')
+
+    def index_page_changed(self, response):
+        """ Checks the index page against its validators from the last crawl,
+            and records the new ones. They're dropped again if any of the
+            page's report requests fail (see report_failed). Servers that
+            don't send an ETag or Last-Modified still get the parse skipped on
+            a content hash match.
+        """
+        if not self.skips_unchanged_index_pages():
+            return True
+
+        # Keyed by the link, the response URL can differ after a redirect.
+        url = response.meta['index_url']
+        if response.status == 304:
+            self.crawler.stats.inc_value('nuforc/index_pages_not_modified')
+            return False
+
+        old_validators = self.index_validators.get(url, {})
+        validators = {
+            'etag': response.headers.get('ETag', b'').decode('latin-1'),
+            'last_modified':
+                response.headers.get('Last-Modified', b'').decode('latin-1'),
+            'content_hash': content_hash(response.body),
+        }
+        self.index_validators[url] = validators
+
+        if old_validators.get('content_hash') == validators['content_hash']:
+            self.crawler.stats.inc_value('nuforc/index_pages_unchanged')
+            return False
+        return True
 
     def parse_date_index(self, response):
 
+        if not self.index_page_changed(response):
+            return
+
         table_rows = response.xpath('//table/tbody/tr')
         
         # Each table row comes with structured summary information.
@@ -61,6 +265,15 @@ class NuforcReportSpider(scrapy.Spider):
 
             report_link =  table_elements[0].xpath('./a/@href').get() \
                 if table_elements[0] else None
+
+            full_report_link = f"http://www.nuforc.org{report_link}" \
+                if report_link else None
+
+            # Don't request reports that have already been scraped.
+            if full_report_link in self.seen_reports:
+                self.crawler.stats.inc_value('nuforc/seen_reports_skipped')
+                continue
+
             city = table_elements[2].xpath('./text()').extract() \
                 if len(table_elements) > 1 else None
             state = table_elements[3].xpath('./text()').extract() \
@@ -82,10 +295,12 @@ class NuforcReportSpider(scrapy.Spider):
             yield response.follow(
                 report_link,
                 self.parse_report_table,
+                errback=self.report_failed,
                 meta={
+                    "index_url": response.meta['index_url'],
                     "report_summary": {
                         "date_time": date_time if date_time else None,
-                        "report_link": f"http://www.nuforc.org{report_link}" if report_link else None, 
+                        "report_link": full_report_link,
                         "city": city[0] if city else None,
                         "state": state[0] if state else None,
                         "country": country[0] if country else None,
@@ -97,25 +312,29 @@ class NuforcReportSpider(scrapy.Spider):
                 }
             )
 
+    def report_failed(self, failure):
+        """ Forgets the validators of the report's index page, so the page is
+            parsed again next crawl and the report is requested again.
+        """
+        url = failure.request.meta['index_url']
+        if self.index_validators.pop(url, None) is not None:
+            self.crawler.stats.inc_value('nuforc/index_pages_failed')
+        self.logger.warning(
+            'Report %s failed, %s will be parsed again next crawl: %r',
+            failure.request.url, url, failure.value
+        )
+
     def parse_report_table(self, response):
 
-        #report is not a table anymore
-        report_area = response.xpath('//div[contains(@class, "content-area clr")]')
+        report_pairs, report_text = parse_report_area(response)
+        report_data = dict(report_pairs)
 
-        # The first row is a rehash (sort of) of the table summary.
-        # Included for completeness.
-        report_data = { k : v for k,v in zip([x.split(":")[0] for x in report_area.xpath('//div[contains(@class, "content-area clr")]//b/text()').getall()], \
-                                     [x for x in [x.strip() for x in report_area.xpath('//div[contains(@class, "content-area clr")]/text()').getall()] if x != '']) }
-        report_zip = zip([x.split(":")[0] for x in report_area.xpath('//div[contains(@class, "content-area clr")]//b/text()').getall()], \
-                                     [x for x in [x.strip() for x in report_area.xpath('//div[contains(@class, "content-area clr")]/text()').getall()] if x != ''])
-        report_text = " ".join([x.strip() for x in report_area.xpath('//div[contains(@class, "content-area clr")]/text()').getall()][9:])
-        
         report_summary = response.meta["report_summary"]
     
         report = {
             "text"    : report_text,
             "duration": report_data["Duration"] if 'Duration' in report_data else None,
-            "stats"   : "|".join([str(k)+":"+str(v) for k,v in report_zip]),
+            "stats"   : "|".join([str(k)+":"+str(v) for k,v in report_pairs]),
             **report_summary
         }
 
@@ -0,0 +1,76 @@
+# Checks that the vectorized cleaning engine produces exactly the same CSV
+# as the per-report engine, and times both.
+
+import click
+import io
+import json
+import sys
+
+from csv import DictWriter
+from time import perf_counter
+
+from process_report_data import (
+    FIELDNAMES,
+    CityCache,
+    load_geocoder,
+    process_report,
+)
+from vectorized_cleaning import iter_report_tables, write_report_tables
+
+
+def run_scalar(raw_report_path, geocode):
+    city_cache = CityCache(geocode)
+    output = io.StringIO()
+    writer = DictWriter(output, fieldnames=FIELDNAMES)
+    writer.writeheader()
+    with open(raw_report_path, "r") as raw_report_file:
+        for report_str in raw_report_file:
+            writer.writerow(
+                process_report(json.loads(report_str), city_cache)
+            )
+    return output.getvalue()
+
+
+def run_vectorized(raw_report_path, geocode):
+    output = io.BytesIO()
+    write_report_tables(iter_report_tables([raw_report_path], geocode), output)
+    return output.getvalue().decode("utf-8")
+
+
+@click.command()
+@click.argument("raw_report_file", type=click.Path(exists=True))
+@click.argument("city_file", type=click.Path(exists=True))
+def main(raw_report_file, city_file):
+    geocode = load_geocoder(city_file)
+
+    outputs = {}
+    engines = [("scalar", run_scalar), ("vectorized", run_vectorized)]
+    for engine, run in engines:
+        start = perf_counter()
+        outputs[engine] = run(raw_report_file, geocode)
+        print(f"{engine}: {perf_counter() - start:.2f}s")
+
+    if outputs["scalar"] == outputs["vectorized"]:
+        print("Outputs are identical.")
+        return
+
+    scalar_lines = outputs["scalar"].splitlines()
+    vectorized_lines = outputs["vectorized"].splitlines()
+    for line_number, (scalar_line, vectorized_line) in enumerate(
+        zip(scalar_lines, vectorized_lines), 1
+    ):
+        if scalar_line != vectorized_line:
+            print(f"First difference on line {line_number}:")
+            print(f"  scalar:     {scalar_line!r}")
+            print(f"  vectorized: {vectorized_line!r}")
+            break
+    else:
+        print(
+            f"Line counts differ: {len(scalar_lines)} scalar, "
+            f"{len(vectorized_lines)} vectorized."
+        )
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import click
+
+from csv import DictReader
+from loguru import logger
+from process_report_data import PARQUET_BATCH_SIZE, write_parquet
+
+
+def read_processed_reports(processed_report_file):
+    """ Yields the rows of the processed report CSV, with None for the empty
+        values the CSV writes for nulls.
+    """
+    for row in DictReader(processed_report_file):
+        yield {
+            name: value if value != "" else None
+            for name, value in row.items()
+        }
+
+
+@click.command()
+@click.argument("processed_report_file", type=click.File("r"))
+@click.argument(
+    "output_file", type=click.Path(dir_okay=False, writable=True)
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=PARQUET_BATCH_SIZE,
+    help="Most reports to hold in memory before writing a row group.",
+)
+def main(processed_report_file, output_file, batch_size):
+    """ Converts the processed report CSV into a typed parquet file, so the
+        reports are cleaned and geocoded once for both.
+    """
+    write_parquet(
+        read_processed_reports(processed_report_file), output_file, batch_size
+    )
+    logger.info(f"Wrote {output_file}.")
+
+
+if __name__ == "__main__":
+    main()
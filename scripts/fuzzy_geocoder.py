@@ -0,0 +1,69 @@
+from collections import Counter, defaultdict
+
+DEFAULT_FUZZY_THRESHOLD = 0.8
+
+
+def trigrams(name):
+    """ The set of character trigrams for a name, padded so the start and
+        end of the name count for more.
+    """
+    padded = f"  {name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyMatcher:
+    """ Finds the closest city in a state by trigram similarity (Dice
+        coefficient). Each state has an inverted index of trigram => cities,
+        so only cities sharing at least one trigram with the name are scored.
+    """
+
+    def __init__(self, city_locations, threshold=DEFAULT_FUZZY_THRESHOLD):
+        """ city_locations is an iterable of
+            ((state, lowercase city), (latitude, longitude)).
+        """
+        self.threshold = threshold
+        # state => trigram => city ids
+        self._postings = defaultdict(lambda: defaultdict(list))
+        # state => [(number of trigrams, latitude, longitude)]
+        self._cities = defaultdict(list)
+
+        for (state, city), (latitude, longitude) in city_locations:
+            state_cities = self._cities[state]
+            city_id = len(state_cities)
+            city_trigrams = trigrams(city)
+            state_cities.append((len(city_trigrams), latitude, longitude))
+            state_postings = self._postings[state]
+            for trigram in city_trigrams:
+                state_postings[trigram].append(city_id)
+
+    def match(self, state, city):
+        """ Returns the latitude and longitude of the most similar city in the
+            state, or (None, None) if nothing is similar enough.
+        """
+        state_postings = self._postings.get(state)
+        if not state_postings:
+            return None, None
+
+        query = trigrams(city.lower())
+        shared_counts = Counter()
+        for trigram in query:
+            shared_counts.update(state_postings.get(trigram, ()))
+
+        state_cities = self._cities[state]
+        best_score = 0.0
+        best_id = None
+        for city_id, shared in shared_counts.items():
+            score = 2 * shared / (len(query) + state_cities[city_id][0])
+            # Ties go to the lowest id so the result doesn't depend on the
+            # order of the trigram set.
+            if (score > best_score) or (
+                score == best_score and city_id < best_id
+            ):
+                best_score = score
+                best_id = city_id
+
+        if best_id is None or best_score < self.threshold:
+            return None, None
+
+        _, latitude, longitude = state_cities[best_id]
+        return latitude, longitude
@@ -0,0 +1,76 @@
+import numpy as np
+import os
+
+# The geocoder index is a directory of .npy files: the sorted
+# "STATE\tlowercase city" keys as utf-8 bytes and the latitude / longitude
+# for each key in the same order. They're memory mapped when loaded, so
+# there's nothing to parse.
+KEYS_FILE = "keys.npy"
+LATITUDES_FILE = "latitudes.npy"
+LONGITUDES_FILE = "longitudes.npy"
+
+
+def index_key(state, city):
+    """ Creates the index key for a state and (lowercase) city.
+    """
+    return f"{state}\t{city}".encode("utf-8")
+
+
+def write_geocoder_index(geocoder_hash, index_dir):
+    """ Writes the geocoder hash ((state, lowercase city) => (lat, lon, ...))
+        to an index directory.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+
+    keys = np.array(
+        [index_key(state, city) for state, city in geocoder_hash.keys()]
+    )
+    locations = np.array(
+        [location[:2] for location in geocoder_hash.values()], dtype=np.float64
+    ).reshape(-1, 2)
+    order = np.argsort(keys, kind="stable")
+
+    np.save(os.path.join(index_dir, KEYS_FILE), keys[order])
+    np.save(os.path.join(index_dir, LATITUDES_FILE), locations[order, 0])
+    np.save(os.path.join(index_dir, LONGITUDES_FILE), locations[order, 1])
+
+
+class GeocoderIndex:
+    """ Geocoder backed by a memory mapped index directory. Called the same
+        way as the geocoder from create_geocoder.
+    """
+
+    def __init__(self, index_dir):
+        self.keys = np.load(os.path.join(index_dir, KEYS_FILE), mmap_mode="r")
+        self.latitudes = np.load(
+            os.path.join(index_dir, LATITUDES_FILE), mmap_mode="r"
+        )
+        self.longitudes = np.load(
+            os.path.join(index_dir, LONGITUDES_FILE), mmap_mode="r"
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __call__(self, state, city):
+        key = index_key(state, city.lower())
+        # Longer keys would be truncated to the key width by searchsorted.
+        if len(key) > self.keys.dtype.itemsize:
+            return None, None
+
+        position = np.searchsorted(self.keys, key)
+        if (position < len(self.keys)) and (self.keys[position] == key):
+            return (
+                float(self.latitudes[position]),
+                float(self.longitudes[position]),
+            )
+        return None, None
+
+    def items(self):
+        """ Yields ((state, lowercase city), (lat, lon)) for every city.
+        """
+        for key, latitude, longitude in zip(
+            self.keys, self.latitudes, self.longitudes
+        ):
+            state, city = key.decode("utf-8").split("\t", 1)
+            yield (state, city), (float(latitude), float(longitude))
@@ -1,11 +1,19 @@
 import elasticsearch
+import hashlib
 import json
 import click
 
-from toolz import iterate, curry, take
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter
+from toolz import curry
 from csv import DictReader
-from elasticsearch.helpers import streaming_bulk
+from elasticsearch.helpers import parallel_bulk, scan
+from loguru import logger
 
+# The reports are served through this alias, which points at a versioned
+# index (nuforc-YYYYMMDDHHMMSS). Full loads build a new index and swap the
+# alias over to it.
 nuforc_report_index_name = 'nuforc'
 nuforc_report_type_name = 'nuforc_report'
 
@@ -27,6 +35,9 @@ nuforc_report_index_body = {
                 "report_link": {
                     "type": "text"
                 },
+                "content_hash": {
+                    "type": "keyword"
+                },
                 "city": {
                     "type": "keyword"
                 },
@@ -61,49 +72,259 @@ nuforc_report_index_body = {
     }
 }
 
-def nuforc_bulk_action(doc, doc_id):
-    """ Binds a document / id to an action for use with the _bulk endpoint.
+# Index settings restored after a bulk load when the index doesn't set them
+# explicitly (the Elasticsearch defaults).
+DEFAULT_REFRESH_INTERVAL = "1s"
+DEFAULT_NUMBER_OF_REPLICAS = "1"
+
+def report_id(report_link):
+    """ Stable document id for a report, so a report keeps its id across
+        loads.
+    """
+    return hashlib.blake2b(
+        report_link.encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+def report_content_hash(doc):
+    return hashlib.blake2b(
+        json.dumps(doc, sort_keys=True).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+@curry
+def nuforc_bulk_action(index_name, doc):
+    """ Binds a document to an action for use with the _bulk endpoint.
     """
     return {
         "_op_type": "index",
-        "_index": nuforc_report_index_name,
+        "_index": index_name,
         "_type": nuforc_report_type_name,
-        "_id": doc_id,
+        "_id": report_id(doc["report_link"]),
         "_source": {
             "location": {
                 "lat": float(doc["city_latitude"]),
                 "lon": float(doc["city_longitude"])
             } if doc["city_latitude"] and doc["city_longitude"] else None,
+            "content_hash": report_content_hash(doc),
             **doc
         }
     }
 
+def versioned_index_name():
+    return f"{nuforc_report_index_name}-{datetime.now():%Y%m%d%H%M%S}"
+
+def aliased_indices(index_client):
+    """ The indices the alias currently points at.
+    """
+    if not index_client.exists_alias(name=nuforc_report_index_name):
+        return []
+    return sorted(index_client.get_alias(name=nuforc_report_index_name))
+
+def swap_alias(index_client, new_index_name):
+    """ Points the alias at the new index in a single atomic update and drops
+        the indices it pointed at before.
+    """
+    old_index_names = aliased_indices(index_client)
+
+    # Before the alias existed the reports were loaded into a plain index
+    # with the alias's name. It has to go before the alias can be created.
+    if not old_index_names and index_client.exists(nuforc_report_index_name):
+        logger.warning(
+            f"Deleting the unaliased {nuforc_report_index_name} index."
+        )
+        index_client.delete(nuforc_report_index_name)
+
+    index_client.update_aliases({
+        "actions": [
+            {
+                "remove": {
+                    "index": old_index_name,
+                    "alias": nuforc_report_index_name
+                }
+            }
+            for old_index_name in old_index_names
+        ] + [
+            {
+                "add": {
+                    "index": new_index_name,
+                    "alias": nuforc_report_index_name
+                }
+            }
+        ]
+    })
+    logger.info(f"Pointed {nuforc_report_index_name} at {new_index_name}.")
+
+    for old_index_name in old_index_names:
+        index_client.delete(old_index_name)
+
+def indexed_content_hashes(client):
+    """ Loads document id => content hash for every report in the aliased
+        index.
+    """
+    return {
+        hit["_id"]: hit["_source"].get("content_hash")
+        for hit in scan(
+            client,
+            index=nuforc_report_index_name,
+            query={"_source": ["content_hash"]},
+            size=5000
+        )
+    }
+
+def changed_actions(report_actions, content_hashes):
+    """ Filters out the actions for documents that are already indexed with
+        the same content.
+    """
+    for action in report_actions:
+        if (
+            content_hashes.get(action["_id"])
+            != action["_source"]["content_hash"]
+        ):
+            yield action
+
+@contextmanager
+def bulk_load_settings(index_client, index_name):
+    """ Turns off refresh and replicas on the index for the duration of a bulk
+        load, then restores the previous settings and refreshes the index so
+        the new documents are searchable.
+    """
+    index_settings = (
+        index_client.get_settings(index=index_name)[index_name]["settings"]
+        .get("index", {})
+    )
+    restore_settings = {
+        "refresh_interval":
+            index_settings.get("refresh_interval", DEFAULT_REFRESH_INTERVAL),
+        "number_of_replicas":
+            index_settings.get(
+                "number_of_replicas", DEFAULT_NUMBER_OF_REPLICAS
+            ),
+    }
+
+    index_client.put_settings(
+        {"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+        index=index_name
+    )
+    try:
+        yield
+    finally:
+        index_client.put_settings({"index": restore_settings}, index=index_name)
+        index_client.refresh(index=index_name)
+
+def bulk_load(client, actions, thread_count, chunk_size, max_chunk_bytes):
+    """ Sends the actions to the _bulk endpoint from a pool of threads. Failed
+        actions are logged rather than stopping the load. Returns the number
+        of documents indexed and the number of failures.
+    """
+    num_indexed = 0
+    num_failed = 0
+    for ok, resp in parallel_bulk(
+        client,
+        actions,
+        thread_count=thread_count,
+        chunk_size=chunk_size,
+        max_chunk_bytes=max_chunk_bytes,
+        raise_on_error=False,
+        raise_on_exception=False
+    ):
+        if ok:
+            num_indexed += 1
+        else:
+            num_failed += 1
+            logger.warning(f"Failed to index: {resp}")
+    return num_indexed, num_failed
+
 @click.command()
 @click.argument("report_file", type=click.File('r'))
-def main(report_file):
+@click.option(
+    "--host",
+    "hosts",
+    multiple=True,
+    default=["localhost:9200"],
+    help="Elasticsearch host, can be given more than once."
+)
+@click.option(
+    "--threads",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Number of threads sending bulk requests."
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=2000,
+    help="Maximum number of documents per bulk request."
+)
+@click.option(
+    "--max-chunk-bytes",
+    type=click.IntRange(min=1),
+    default=10 * 1024 * 1024,
+    help="Maximum size of a bulk request in bytes."
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help=(
+        "Only index the reports that are new or changed since the last load, "
+        "into the index behind the alias."
+    )
+)
+def main(report_file, hosts, threads, chunk_size, max_chunk_bytes, incremental):
     """ Creates an Elasticsearch index for the NUFORC reports and loads the
-        processed CSV file into it.
+        processed CSV file into it. The new index is swapped in behind the
+        nuforc alias once it's loaded, so the reports stay searchable
+        throughout.
     """
-    client = elasticsearch.Elasticsearch()
+    client = elasticsearch.Elasticsearch(list(hosts))
     index_client = elasticsearch.client.IndicesClient(client)
 
-    # Drop the index if it exists; it will be replaced. This is the most efficient
-    # way to delete the data from an index according to ES documentation.
-    if index_client.exists(nuforc_report_index_name):
-        index_client.delete(nuforc_report_index_name)
+    reports = DictReader(report_file)
 
-    # Create the index with the appropriate mapping.
-    index_client.create(nuforc_report_index_name, nuforc_report_index_body)
+    if incremental and not aliased_indices(index_client):
+        logger.warning(
+            f"No {nuforc_report_index_name} alias to update, doing a full "
+            "load."
+        )
+        incremental = False
 
-    reports = DictReader(report_file)
+    start = perf_counter()
+    if incremental:
+        # Writes through the alias go to the index behind it.
+        content_hashes = indexed_content_hashes(client)
+        logger.info(f"Loaded {len(content_hashes)} indexed content hashes.")
+        report_actions = changed_actions(
+            map(nuforc_bulk_action(nuforc_report_index_name), reports),
+            content_hashes
+        )
+        num_indexed, num_failed = bulk_load(
+            client, report_actions, threads, chunk_size, max_chunk_bytes
+        )
+        index_client.refresh(index=nuforc_report_index_name)
+    else:
+        # Create a new index with the appropriate mapping.
+        index_name = versioned_index_name()
+        index_client.create(index_name, nuforc_report_index_body)
 
-    # Zip the reports with an id generator, embedding them in the actions.
-    report_actions = map(nuforc_bulk_action, reports, iterate(lambda x: x+1, 0))
+        # Load the reports into the new index without refreshing or
+        # replicating until they're all in, then swap it in.
+        report_actions = map(nuforc_bulk_action(index_name), reports)
+        with bulk_load_settings(index_client, index_name):
+            num_indexed, num_failed = bulk_load(
+                client, report_actions, threads, chunk_size, max_chunk_bytes
+            )
+        # Keep serving the old index rather than swap in an incomplete one.
+        if num_failed:
+            raise click.ClickException(
+                f"{num_failed} reports failed to index, leaving "
+                f"{nuforc_report_index_name} on the old index. The new index "
+                f"{index_name} was kept for inspection."
+            )
+        swap_alias(index_client, index_name)
+    elapsed = perf_counter() - start
 
-    # Stream the reports into the ES database.
-    for ok,resp in elasticsearch.helpers.streaming_bulk(client, report_actions):
-        if not ok:
-            print(resp)
+    logger.info(
+        f"Indexed {num_indexed} reports ({num_failed} failed) in "
+        f"{elapsed:.1f}s, {num_indexed / elapsed:.0f} docs/s."
+    )
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
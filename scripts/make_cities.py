@@ -1,6 +1,42 @@
 import click
 import pandas as pd
 
+from profiling import Profiler
+
+CITY_COLUMNS = [
+    "country_iso_code",
+    "country_name",
+    "subdivision_1_iso_code",
+    "subdivision_1_name",
+    "city_name",
+]
+
+# Only the columns that get aggregated are read from the blocks file, which
+# has millions of rows. geoname_id is read as a float because it's missing
+# for some blocks, then narrowed once those are dropped. The coordinates
+# stay 64 bit so the city averages don't change.
+BLOCK_DTYPES = {
+    "geoname_id": "float64",
+    "latitude": "float64",
+    "longitude": "float64",
+}
+
+
+def sum_blocks(ip_locations):
+    """ Coordinate sums and block counts per geoname_id for a chunk of the
+        blocks file.
+    """
+    ip_locations = ip_locations.dropna(subset=["geoname_id"])
+    return (
+        ip_locations.astype({"geoname_id": "int32"})
+        .groupby("geoname_id")
+        .agg(
+            latitude=("latitude", "sum"),
+            longitude=("longitude", "sum"),
+            num_blocks=("latitude", "size"),
+        )
+    )
+
 
 @click.command()
 @click.argument("city_location_file", type=click.File("r"))
@@ -8,36 +44,75 @@ import pandas as pd
 @click.option(
     "--output-file", "-o", type=click.File("w"), default="output.csv"
 )
-def main(city_location_file, ip_location_file, output_file):
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    default=1000000,
+    help="Blocks to read at a time.",
+)
+@click.option(
+    "--profile",
+    "metrics_file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Time the phases and write the metrics JSON here.",
+)
+def main(
+    city_location_file, ip_location_file, output_file, chunk_size, metrics_file
+):
+    """ Averages the GeoLite2 IPv4 block coordinates into a location for
+        every city. The blocks are streamed in chunks and summed per
+        geoname_id, and the city names are only joined on to those sums.
+    """
+    profiler = Profiler("make_cities")
 
     # country = country_iso_code
     # state = subdivision_1_iso_code
     # city = city_name
     # join key = geoname_id
-    cities = pd.read_csv(city_location_file).set_index("geoname_id")
+    with profiler.phase("read_locations"):
+        cities = pd.read_csv(
+            city_location_file,
+            usecols=["geoname_id"] + CITY_COLUMNS,
+            dtype={"geoname_id": "int32"},
+            index_col="geoname_id",
+        )
 
     # latitude = latitude
     # longitude = longitude
     # join key = geoname_id
-    ip_locations = pd.read_csv(ip_location_file)
-
-    city_locations = (
-        ip_locations.join(cities, on="geoname_id", how="inner")
-        .groupby(
-            [
-                "country_iso_code",
-                "country_name",
-                "subdivision_1_iso_code",
-                "subdivision_1_name",
-                "city_name",
-            ]
+    block_sums = []
+    with profiler.phase("sum_blocks"):
+        for ip_locations in pd.read_csv(
+            ip_location_file,
+            usecols=list(BLOCK_DTYPES),
+            dtype=BLOCK_DTYPES,
+            chunksize=chunk_size,
+        ):
+            profiler.add_rows(len(ip_locations))
+            block_sums.append(sum_blocks(ip_locations))
+        # A geoname_id can span chunks.
+        block_sums = pd.concat(block_sums).groupby(level=0).sum()
+
+    # Different geoname_ids can share a city name within a subdivision, so
+    # the sums are grouped again by name before averaging.
+    with profiler.phase("join_groupby", rows=len(block_sums)):
+        city_locations = (
+            block_sums.join(cities, how="inner")
+            .groupby(CITY_COLUMNS)[["latitude", "longitude", "num_blocks"]]
+            .sum()
+            .reset_index()
         )
-        .agg({"latitude": "mean", "longitude": "mean", "geoname_id": "count"})
-        .reset_index()
-        .rename(columns={"geoname_id": "num_blocks"})
-    )
+        city_locations["latitude"] /= city_locations["num_blocks"]
+        city_locations["longitude"] /= city_locations["num_blocks"]
+        city_locations = city_locations[
+            CITY_COLUMNS + ["latitude", "longitude", "num_blocks"]
+        ]
+
+    with profiler.phase("write_csv", rows=len(city_locations)):
+        city_locations.to_csv(output_file, index=False)
 
-    city_locations.to_csv(output_file, index=False)
+    profiler.write(metrics_file)
 
 
 if __name__ == "__main__":
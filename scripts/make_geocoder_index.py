@@ -0,0 +1,24 @@
+import click
+
+from geocoder_index import write_geocoder_index
+from loguru import logger
+from process_report_data import load_geocoder_hash
+
+
+@click.command()
+@click.argument("city_file", type=click.File("r"))
+@click.argument("index_dir", type=click.Path(file_okay=False, writable=True))
+def main(city_file, index_dir):
+    """ Compiles the city file into a memory mappable geocoder index that
+        process_report_data.py can load without parsing the CSV.
+    """
+    logger.info(f"Loading cities from {city_file.name}.")
+    geocoder_hash = load_geocoder_hash(city_file)
+
+    logger.info(f"Writing {len(geocoder_hash)} cities to {index_dir}.")
+    write_geocoder_index(geocoder_hash, index_dir)
+    logger.info(" 🛸 Done 🛸 ")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import click
+import duckdb
+import hashlib
+import os
+
+from loguru import logger
+
+# The dashboard's "recent" charts cover the last 100 days from whenever the
+# app runs. The per day rollups behind them keep a longer window so they're
+# still complete when the database is a few months older than the app run.
+RECENT_ROLLUP_DAYS = 400
+
+# All of the dashboard's counts from a single scan over the reports. NULL
+# categories are coalesced first, so a NULL in the output only ever means the
+# column isn't part of the grouping set.
+ROLLUP_QUERY = f"""
+    CREATE TEMP TABLE report_rollups AS
+    SELECT
+        GROUPING(
+            date_time_day, posted_day, recent_day, shape, country, state
+        ) AS grouping_id,
+        date_time_day,
+        posted_day,
+        recent_day,
+        shape,
+        country,
+        state,
+        COUNT(*) AS num_reports
+    FROM (
+        SELECT
+            DATE_TRUNC('day', date_time) AS date_time_day,
+            DATE_TRUNC('day', posted) AS posted_day,
+            CASE
+                WHEN date_time >= CURRENT_DATE - {RECENT_ROLLUP_DAYS}
+                THEN date_time::DATE
+            END AS recent_day,
+            COALESCE(shape, 'none') AS shape,
+            COALESCE(country, 'none') AS country,
+            COALESCE(state, 'none') AS state
+        FROM nuforc_reports
+    )
+    GROUP BY GROUPING SETS (
+        (date_time_day),
+        (posted_day),
+        (shape),
+        (country),
+        (state),
+        (recent_day, shape),
+        (recent_day, country),
+        (recent_day, state)
+    )
+"""
+
+
+def rollup_columns(*columns):
+    """ The grouping_id of the grouping set over the given rollup columns.
+    """
+    rollup_columns = [
+        "date_time_day",
+        "posted_day",
+        "recent_day",
+        "shape",
+        "country",
+        "state",
+    ]
+    return sum(
+        1 << (len(rollup_columns) - 1 - i)
+        for i, column in enumerate(rollup_columns)
+        if column not in columns
+    )
+
+
+# Summary table => the query that materializes it from the rollups.
+SUMMARY_TABLES = {
+    "date_time_counts": f"""
+        SELECT date_time_day AS day, num_reports
+        FROM report_rollups
+        WHERE
+            grouping_id = {rollup_columns("date_time_day")} AND
+            date_time_day IS NOT NULL
+    """,
+    "posted_counts": f"""
+        SELECT posted_day AS day, num_reports
+        FROM report_rollups
+        WHERE
+            grouping_id = {rollup_columns("posted_day")} AND
+            posted_day IS NOT NULL
+    """,
+    **{
+        f"{column}_counts": f"""
+            SELECT {column}, num_reports
+            FROM report_rollups
+            WHERE grouping_id = {rollup_columns(column)}
+        """
+        for column in ["shape", "country", "state"]
+    },
+    **{
+        f"recent_{column}_counts": f"""
+            SELECT recent_day AS day, {column}, num_reports
+            FROM report_rollups
+            WHERE
+                grouping_id = {rollup_columns("recent_day", column)} AND
+                recent_day IS NOT NULL
+        """
+        for column in ["shape", "country", "state"]
+    },
+    "latest_reports": """
+        SELECT *
+        FROM nuforc_reports
+        WHERE posted IS NOT NULL
+        ORDER BY posted DESC
+        LIMIT 100
+    """,
+    # The map bins these into a grid at the chosen level of detail.
+    "geo_counts": """
+        SELECT
+            city_latitude AS latitude,
+            city_longitude AS longitude,
+            COUNT(*) AS num_reports
+        FROM
+            nuforc_reports
+        WHERE
+            latitude IS NOT NULL AND
+            longitude IS NOT NULL
+        GROUP BY 1, 2
+    """,
+}
+
+
+def create_summary_tables(db):
+    """ Materializes the dashboard's summary tables from the reports table.
+    """
+    db.execute(ROLLUP_QUERY)
+    for table_name, query in SUMMARY_TABLES.items():
+        db.execute(f"CREATE TABLE {table_name} AS {query}")
+    db.execute("DROP TABLE report_rollups")
+
+
+def data_version(report_file):
+    """ The md5 of the report file, the same hash DVC tracks it by.
+    """
+    md5 = hashlib.md5()
+    with open(report_file, "rb") as report_bytes:
+        for block in iter(lambda: report_bytes.read(1 << 20), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+@click.command()
+@click.argument("report_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("database_file", type=click.Path(dir_okay=False, writable=True))
+def main(report_file, database_file):
+    """ Loads the processed report CSV into a DuckDB database file for the QA
+        app, so the app doesn't have to parse the CSV on every rerun. The
+        dashboard's counts are precomputed into small summary tables.
+    """
+    # Build into a temporary file and move it into place, so a running app
+    # never sees a half built database.
+    temp_database_file = f"{database_file}.tmp"
+    if os.path.exists(temp_database_file):
+        os.remove(temp_database_file)
+
+    logger.info(f"Loading {report_file} into {database_file}.")
+    with duckdb.connect(temp_database_file) as db:
+        db.execute(
+            "CREATE TABLE nuforc_reports AS SELECT * FROM read_csv_auto(?)",
+            [report_file],
+        )
+        create_summary_tables(db)
+        # The app keys its query cache on this.
+        db.execute(
+            "CREATE TABLE build_info AS SELECT ? AS data_version",
+            [data_version(report_file)],
+        )
+        num_reports = db.execute(
+            "SELECT COUNT(*) FROM nuforc_reports"
+        ).fetchone()[0]
+    os.replace(temp_database_file, database_file)
+
+    logger.info(f"Loaded {num_reports} reports.")
+    logger.info(" 🛸 Done 🛸 ")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,105 @@
 import click
+import fuzzy_geocoder
+import hashlib
+import io
 import json
+import multiprocessing
+import os
 import re
 
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from collections import Counter, OrderedDict
 from csv import DictReader, DictWriter
-from datetime import datetime, timedelta
-from toolz import curry, get_in
+from datetime import datetime
+from geocoder_index import GeocoderIndex
+from loguru import logger
+from profiling import Profiler
+from report_store import segment_paths
+from toolz import curry
 
 REPORT_DATE_TIME = "%m/%d/%y %H:%M"
 SHORT_REPORT_DATE_TIME = "%m/%d/%y"
+# The way the NUFORC site writes both formats. Anything else strptime
+# accepts (single digit minutes, extra whitespace) takes the slow path.
+REPORT_DATE_TIME_RE = re.compile(
+    r"([0-9]{1,2})/([0-9]{1,2})/([0-9]{2})(?: ([0-9]{1,2}):([0-9]{2}))?"
+)
+DEFAULT_DATE_TIME_CACHE_SIZE = 200000
+DEFAULT_CITY_CACHE_SIZE = 50000
+PARQUET_BATCH_SIZE = 100000
+
+
+class DateTimeParser:
+    """ Parses report date times, and remembers them. The posted dates and
+        the sighting dates repeat a lot across reports, so most are only
+        parsed once. Two digit years that come out after now are moved back
+        a century, with now fixed when the parser is created.
+    """
+
+    def __init__(self, now=None, maxsize=DEFAULT_DATE_TIME_CACHE_SIZE):
+        self.now = now or datetime.now()
+        self.maxsize = maxsize
+        self._parsed = {}
+
+    def _parse(self, report_date_time):
+        match = REPORT_DATE_TIME_RE.fullmatch(report_date_time)
+        try:
+            if match:
+                month, day, year, hour, minute = match.groups()
+                # Same pivot as strptime's %y.
+                year = int(year)
+                year += 1900 if year >= 69 else 2000
+                date_time = datetime(
+                    year,
+                    int(month),
+                    int(day),
+                    int(hour or 0),
+                    int(minute or 0),
+                )
+            else:
+                try:
+                    date_time = datetime.strptime(
+                        report_date_time, REPORT_DATE_TIME
+                    )
+                except ValueError:
+                    # Some of the dates are in the "short" format.
+                    date_time = datetime.strptime(
+                        report_date_time, SHORT_REPORT_DATE_TIME
+                    )
+        except ValueError:
+            return None
+
+        # Correct century for future dates.
+        if date_time > self.now:
+            date_time = date_time.replace(year=date_time.year - 100)
+        return date_time
+
+    def parse(self, report_date_time):
+        """ Returns the datetime for the report date time string, or None if
+            it isn't in either format.
+        """
+        try:
+            return self._parsed[report_date_time]
+        except KeyError:
+            pass
+        date_time = self._parse(report_date_time)
+        if len(self._parsed) < self.maxsize:
+            self._parsed[report_date_time] = date_time
+        return date_time
+
+
+_date_time_parser = DateTimeParser()
 
 
 def create_date_time(report_date_time):
     """ Takes a report datetime as a string and converts it into a datetime
         object.
     """
-    try:
-        date_time = datetime.strptime(report_date_time, REPORT_DATE_TIME)
-    except ValueError:
-        # Some of the dates are in the "short" format.
-        date_time = datetime.strptime(report_date_time, SHORT_REPORT_DATE_TIME)
-
-    # Correct century for future dates.
-    if date_time > datetime.now():
-        date_time = date_time - timedelta(year=100)
+    date_time = _date_time_parser.parse(report_date_time)
+    if date_time is None:
+        raise ValueError(f"Unparseable report date time {report_date_time!r}")
     return date_time
 
 
@@ -157,15 +234,13 @@ def _geocoder_template(geocoder_hash, state, city):
     """ This is the template function for the geocoder. It's meant to have the
         first argument (the hash) bound.
     """
-    return (
-        get_in([(state, city.lower()), 0], geocoder_hash, None),
-        get_in([(state, city.lower()), 1], geocoder_hash, None),
-    )
+    location = geocoder_hash.get((state, city.lower()))
+    return (location[0], location[1]) if location else (None, None)
 
 
-def create_geocoder(city_file):
-    """ Creates a geocoder function for cities that takes a city name and region
-        and returns the latitude and longitude.
+def load_geocoder_hash(city_file):
+    """ Loads the city file into a hash of (state, lowercase city) to
+        (latitude, longitude, number of blocks).
     """
     reader = DictReader(city_file)
 
@@ -190,95 +265,789 @@ def create_geocoder(city_file):
                 int(row["num_blocks"]),
             )
 
+    return geocoder_hash
+
+
+def create_geocoder(city_file):
+    """ Creates a geocoder function for cities that takes a city name and region
+        and returns the latitude and longitude.
+    """
     # Bind the geocoder hash to the geocoder template.
-    return curry(_geocoder_template)(geocoder_hash)
+    return curry(_geocoder_template)(load_geocoder_hash(city_file))
 
 
-@click.command()
-@click.argument("raw_report_file", type=click.File("r"))
-@click.argument("city_file", type=click.File("r"))
-@click.option(
-    "--output-file", "-o", type=click.File("w"), default="output.csv"
+def load_geocoder(city_path):
+    """ Loads the geocoder from either a city CSV file or a geocoder index
+        directory built by make_geocoder_index.py.
+    """
+    if os.path.isdir(city_path):
+        return GeocoderIndex(city_path)
+
+    with open(city_path, "r") as city_file:
+        return create_geocoder(city_file)
+
+
+def load_city_locations(city_path):
+    """ Loads ((state, lowercase city), (lat, lon)) for every city from either
+        a city CSV file or a geocoder index directory.
+    """
+    if os.path.isdir(city_path):
+        return list(GeocoderIndex(city_path).items())
+
+    with open(city_path, "r") as city_file:
+        return [
+            (key, location[:2])
+            for key, location in load_geocoder_hash(city_file).items()
+        ]
+
+
+def clean_and_geocode_city(
+    city, state, geocode, fuzzy_matcher=None, clean=clean_city
+):
+    """ Cleans the city with clean and geocodes it, falling back to the fuzzy
+        matcher if there is one. The state must already be cleaned. Returns
+        the clean city, latitude, longitude and whether the fuzzy matcher
+        found it.
+    """
+    new_city = clean(city, state)
+    city_lat, city_lon = geocode(state, new_city) if new_city else (None, None)
+    fuzzy = False
+    if new_city and (city_lat is None) and fuzzy_matcher:
+        city_lat, city_lon = fuzzy_matcher.match(state, new_city)
+        fuzzy = city_lat is not None
+    return new_city, city_lat, city_lon, fuzzy
+
+
+class CityCache:
+    """ Bounded LRU cache of raw (city, state) => (clean city, lat, lon).
+        The same city / state pairs show up over and over in the reports, so
+        most of them only get cleaned and geocoded once. If there's a fuzzy
+        matcher it's used for cities the geocoder can't find. The cities are
+        cleaned with clean.
+    """
+
+    def __init__(
+        self,
+        geocode,
+        maxsize=DEFAULT_CITY_CACHE_SIZE,
+        fuzzy_matcher=None,
+        clean=clean_city,
+    ):
+        self.geocode = geocode
+        self.maxsize = maxsize
+        self.fuzzy_matcher = fuzzy_matcher
+        self.clean = clean
+        self.stats = Counter(hits=0, misses=0, evictions=0, fuzzy_matches=0)
+        self._entries = OrderedDict()
+
+    def locate(self, city, state):
+        """ Cleans the city and geocodes it. The state must already be
+            cleaned.
+        """
+        key = (city, state)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            new_city, city_lat, city_lon, fuzzy = self._entries[key]
+        else:
+            self.stats["misses"] += 1
+            new_city, city_lat, city_lon, fuzzy = clean_and_geocode_city(
+                city, state, self.geocode, self.fuzzy_matcher, self.clean
+            )
+
+            self._entries[key] = (new_city, city_lat, city_lon, fuzzy)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+        # Counted per report rather than per city.
+        if fuzzy:
+            self.stats["fuzzy_matches"] += 1
+
+        return new_city, city_lat, city_lon
+
+    def pop_stats(self):
+        """ Returns the stats since the last call and resets them.
+        """
+        stats = self.stats
+        self.stats = Counter(hits=0, misses=0, evictions=0, fuzzy_matches=0)
+        return stats
+
+    def log_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        hit_rate = self.stats["hits"] / lookups if lookups else 0.0
+        logger.info(
+            f"City cache: {self.stats['hits']} hits, "
+            f"{self.stats['misses']} misses, "
+            f"{self.stats['evictions']} evictions "
+            f"({hit_rate:.1%} hit rate)."
+        )
+        if self.fuzzy_matcher:
+            logger.info(
+                f"Fuzzy matching recovered {self.stats['fuzzy_matches']} "
+                "reports."
+            )
+
+
+FIELDNAMES = [
+    "summary",
+    "country",
+    "city",
+    "state",
+    "date_time",
+    "shape",
+    "duration",
+    "stats",
+    "report_link",
+    "text",
+    "posted",
+    "city_latitude",
+    "city_longitude",
+]
+
+PARQUET_SCHEMA = pa.schema(
+    [
+        ("summary", pa.string()),
+        ("country", pa.dictionary(pa.int32(), pa.string())),
+        ("city", pa.string()),
+        ("state", pa.dictionary(pa.int32(), pa.string())),
+        ("date_time", pa.timestamp("s")),
+        ("shape", pa.dictionary(pa.int32(), pa.string())),
+        ("duration", pa.string()),
+        ("stats", pa.string()),
+        ("report_link", pa.string()),
+        ("text", pa.string()),
+        ("posted", pa.timestamp("s")),
+        ("city_latitude", pa.float32()),
+        ("city_longitude", pa.float32()),
+    ]
 )
-def main(raw_report_file, city_file, output_file):
-    """ Reads the raw scraped JSON reports and processes them into a CSV file
-        whilst performing data enrichment and cleaning. 
-    """
-
-    # Create the geocoder function.
-    geocode = create_geocoder(city_file)
-
-    writer = DictWriter(
-        output_file,
-        fieldnames=[
-            "summary",
-            "country",
-            "city",
-            "state",
-            "date_time",
-            "shape",
-            "duration",
-            "stats",
-            "report_link",
-            "text",
-            "posted",
-            "city_latitude",
-            "city_longitude",
-        ],
+
+
+def decode_report(report_str):
+    """ Decodes a raw report line.
+    """
+    return json.loads(report_str)
+
+
+def standardize_date_time(report_date_time):
+    """ The report date time in isoformat, or None if it can't be parsed.
+    """
+    try:
+        return create_date_time(report_date_time).isoformat()
+    except Exception:
+        return None
+
+
+def process_report(report, city_cache, standardize=standardize_date_time):
+    """ Cleans and geocodes a single raw report dict in place and returns it.
+        The dates are standardized with standardize.
+    """
+    # Standardize the dates into isoformat. If either fails to parse, both
+    # are null.
+    posted_date_time = standardize(report.get("posted"))
+    report_date_time = standardize(report.get("date_time"))
+    if posted_date_time is None or report_date_time is None:
+        posted_date_time = None
+        report_date_time = None
+
+    report["posted"] = posted_date_time
+    report["date_time"] = report_date_time
+
+    # Clean the shape.
+    report["shape"] = (
+        clean_shape(report["shape"]) if report["shape"] else report["shape"]
+    )
+
+    # Clean the state abbreviations.
+    report["state"] = (
+        clean_state(report["state"]) if report["state"] else report["state"]
     )
 
-    writer.writeheader()
+    # Clean the city and geocode the report.
+    if report["city"] and report["state"]:
+        (
+            report["city"],
+            report["city_latitude"],
+            report["city_longitude"],
+        ) = city_cache.locate(report["city"], report["state"])
+    else:
+        report["city_latitude"] = None
+        report["city_longitude"] = None
 
-    for report_str in raw_report_file:
+    return report
 
-        report = json.loads(report_str)
 
-        try:
-            # Standardize the dates into isoformat.
-            posted_date_time = create_date_time(report["posted"]).isoformat()
-            report_date_time = create_date_time(
-                report["date_time"],
-            ).isoformat()
-        except Exception as e:
-            posted_date_time = None
-            report_date_time = None
-
-        report["posted"] = posted_date_time
-        report["date_time"] = report_date_time
-
-        # Clean the shape.
-        report["shape"] = (
-            clean_shape(report["shape"])
-            if report["shape"]
-            else report["shape"]
+def find_chunks(raw_report_path, num_chunks):
+    """ Splits the raw report file into roughly equal byte ranges that start
+        and end on line boundaries. Returns a list of (start, end) offsets.
+    """
+    file_size = os.path.getsize(raw_report_path)
+    chunk_size = max(1, file_size // num_chunks)
+
+    boundaries = [0]
+    with open(raw_report_path, "rb") as raw_report_file:
+        for offset in range(chunk_size, file_size, chunk_size):
+            if offset <= boundaries[-1]:
+                continue
+            # Move the boundary to the start of the next line.
+            raw_report_file.seek(offset)
+            raw_report_file.readline()
+            boundary = raw_report_file.tell()
+            if boundary >= file_size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+# The city cache for the worker processes. It's set by the pool initializer
+# so the geocoder table is handed to each worker once rather than with every
+# chunk.
+_worker_city_cache = None
+
+
+def _init_worker(geocode, city_cache_size, fuzzy_matcher):
+    global _worker_city_cache
+    _worker_city_cache = CityCache(geocode, city_cache_size, fuzzy_matcher)
+
+
+def _process_chunk_reports(chunk):
+    """ Processes the reports in one byte range of the raw report file and
+        returns them as a list of dicts, along with the city cache stats for
+        the chunk.
+    """
+    raw_report_path, start, end = chunk
+    reports = []
+
+    with open(raw_report_path, "rb") as raw_report_file:
+        raw_report_file.seek(start)
+        while raw_report_file.tell() < end:
+            report_line = raw_report_file.readline()
+            if not report_line:
+                break
+            report = json.loads(report_line)
+            reports.append(process_report(report, _worker_city_cache))
+
+    stats = _worker_city_cache.pop_stats()
+    stats["reports"] = len(reports)
+    return reports, stats
+
+
+def _process_chunk(chunk):
+    """ Processes the reports in one byte range of the raw report file and
+        returns the rendered CSV rows as a string, along with the city cache
+        stats for the chunk.
+    """
+    reports, stats = _process_chunk_reports(chunk)
+    output = io.StringIO()
+    writer = DictWriter(output, fieldnames=FIELDNAMES)
+    writer.writerows(reports)
+    return output.getvalue(), stats
+
+
+def make_chunks(raw_report_paths, workers):
+    """ Splits the raw report files into more chunks than workers so a slow
+        chunk doesn't hold up the whole pool. Each file gets a share of the
+        chunks proportional to its size.
+    """
+    num_chunks = workers * 4
+    total_size = sum(map(os.path.getsize, raw_report_paths)) or 1
+    return [
+        (raw_report_path, start, end)
+        for raw_report_path in raw_report_paths
+        for start, end in find_chunks(
+            raw_report_path,
+            max(
+                1,
+                round(
+                    num_chunks * os.path.getsize(raw_report_path) / total_size
+                ),
+            ),
+        )
+    ]
+
+
+def raw_report_paths(raw_report_path):
+    """ The raw report files to read: the segments if it's a report store
+        directory, otherwise the file itself.
+    """
+    if os.path.isdir(raw_report_path):
+        return segment_paths(raw_report_path)
+    return [raw_report_path]
+
+
+def iter_raw_reports(raw_report_paths):
+    """ Yields the raw JSON lines from the raw report files in order.
+    """
+    for raw_report_path in raw_report_paths:
+        with open(raw_report_path, "r") as raw_report_file:
+            yield from raw_report_file
+
+
+def make_pool(city_cache, workers):
+    """ Creates the worker pool, each with its own city cache. Forks so the
+        workers inherit the geocoder table instead of pickling it.
+    """
+    context = multiprocessing.get_context("fork")
+    return context.Pool(
+        workers,
+        initializer=_init_worker,
+        initargs=(
+            city_cache.geocode,
+            city_cache.maxsize,
+            city_cache.fuzzy_matcher,
+        ),
+    )
+
+
+def iter_processed_reports(raw_report_paths, city_cache, workers):
+    """ Yields the processed reports in the order of the raw report files,
+        using a worker pool if there's more than one worker. The workers'
+        cache stats are added to city_cache.
+    """
+    if workers == 1:
+        for report_str in iter_raw_reports(raw_report_paths):
+            yield process_report(decode_report(report_str), city_cache)
+        return
+
+    with make_pool(city_cache, workers) as pool:
+        for reports, stats in pool.imap(
+            _process_chunk_reports, make_chunks(raw_report_paths, workers)
+        ):
+            stats.pop("reports")
+            city_cache.stats.update(stats)
+            yield from reports
+
+
+def _parse_iso_date_time(date_time):
+    return datetime.fromisoformat(date_time) if date_time else None
+
+
+def _parse_float(value):
+    return float(value) if value not in (None, "") else None
+
+
+def write_parquet(reports, output_path, batch_size=PARQUET_BATCH_SIZE):
+    """ Writes the processed reports to a parquet file with a typed schema.
+        Reports are grouped by the year of the sighting and every row group
+        holds a single year, so readers can skip years they don't need.
+        At most batch_size reports are held at once. When that many are
+        buffered the year with the most reports is written out, the rest
+        are written in year order at the end with undated reports last.
+    """
+    converters = {
+        "date_time": _parse_iso_date_time,
+        "posted": _parse_iso_date_time,
+        "city_latitude": _parse_float,
+        "city_longitude": _parse_float,
+    }
+
+    with pq.ParquetWriter(output_path, PARQUET_SCHEMA) as writer:
+        # year => column name => values
+        years = {}
+        num_buffered = 0
+
+        def write_year(year):
+            table = pa.Table.from_pydict(
+                years.pop(year), schema=PARQUET_SCHEMA
+            )
+            writer.write_table(table, row_group_size=max(1, table.num_rows))
+            return table.num_rows
+
+        for report in reports:
+            date_time = converters["date_time"](report["date_time"])
+            year = date_time.year if date_time else None
+            if year not in years:
+                years[year] = {name: [] for name in FIELDNAMES}
+            columns = years[year]
+            for name in FIELDNAMES:
+                value = report.get(name)
+                columns[name].append(
+                    converters[name](value) if name in converters else value
+                )
+
+            num_buffered += 1
+            if num_buffered >= batch_size:
+                num_buffered -= write_year(
+                    max(years, key=lambda y: len(years[y]["report_link"]))
+                )
+
+        for year in sorted(years, key=lambda y: (y is None, y)):
+            write_year(year)
+
+
+def report_hash(report_str):
+    """ Hashes the raw JSON line of a report so changed reports can be
+        detected between runs.
+    """
+    return hashlib.blake2b(
+        report_str.strip().encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def file_hash(path):
+    """ Hashes the contents of a file in blocks. Directories are hashed file
+        by file in name order.
+    """
+    if os.path.isdir(path):
+        paths = [
+            os.path.join(path, name) for name in sorted(os.listdir(path))
+        ]
+    else:
+        paths = [path]
+
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path in paths:
+        with open(file_path, "rb") as hash_file:
+            for block in iter(lambda: hash_file.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_incremental_state(state_path, output_path, fingerprint):
+    """ Loads the report hashes from the previous run, in output row order,
+        along with the byte offsets of the rows in the previous output (one
+        more offset than rows, the last is the end of the file). Returns
+        empty state if there's no usable previous run, which forces a full
+        rebuild.
+    """
+    if not (os.path.exists(state_path) and os.path.exists(output_path)):
+        return [], []
+
+    with open(state_path, "r") as state_file:
+        state = json.load(state_file)
+
+    # A different city file or processing script can change every report.
+    if state.get("fingerprint") != fingerprint:
+        logger.info("Inputs changed since the last run, rebuilding.")
+        return [], []
+
+    # The offsets are only good for the output they were recorded with.
+    if state.get("output_size") != os.path.getsize(output_path):
+        logger.info("The output changed since the last run, rebuilding.")
+        return [], []
+
+    return (
+        state["report_hashes"],
+        state["row_offsets"] + [state["output_size"]],
+    )
+
+
+def render_row(writer, row_buffer, report):
+    """ Renders one CSV row with the writer into its buffer and returns the
+        bytes.
+    """
+    row_buffer.seek(0)
+    row_buffer.truncate()
+    writer.writerow(report)
+    return row_buffer.getvalue().encode("utf-8")
+
+
+def process_incremental(
+    raw_report_paths, city_cache, output_path, state_path, fingerprint
+):
+    """ Processes only the reports that are new or have changed since the
+        last run, copying the previously processed rows for the rest. Reports
+        are matched on the hash of their raw line, so unchanged reports are
+        never decoded. If nothing changed the output is left alone, otherwise
+        it's written to a temporary file and moved into place once complete.
+        Returns the number of reports.
+    """
+    report_hashes, row_bounds = load_incremental_state(
+        state_path, output_path, fingerprint
+    )
+    new_report_hashes = [
+        report_hash(report_str)
+        for report_str in iter_raw_reports(raw_report_paths)
+    ]
+    num_reports = len(new_report_hashes)
+
+    if report_hashes and new_report_hashes == report_hashes:
+        logger.info(f"None of the {num_reports} reports changed.")
+        return num_reports
+
+    # hash => (start, end) of its row in the previous output.
+    previous_rows = {
+        previous_hash: (row_bounds[row], row_bounds[row + 1])
+        for row, previous_hash in enumerate(report_hashes)
+    }
+    row_buffer = io.StringIO()
+    writer = DictWriter(row_buffer, fieldnames=FIELDNAMES)
+    row_offsets = []
+    num_processed = 0
+
+    temp_output_path = f"{output_path}.tmp"
+    # Without previous rows there may be no previous output to open.
+    with open(
+        output_path if previous_rows else os.devnull, "rb"
+    ) as previous_output_file, open(temp_output_path, "wb") as output_file:
+        writer.writeheader()
+        output_file.write(row_buffer.getvalue().encode("utf-8"))
+
+        for report_str, current_hash in zip(
+            iter_raw_reports(raw_report_paths), new_report_hashes
+        ):
+            row_offsets.append(output_file.tell())
+            if current_hash in previous_rows:
+                start, end = previous_rows[current_hash]
+                previous_output_file.seek(start)
+                output_file.write(previous_output_file.read(end - start))
+            else:
+                report = decode_report(report_str)
+                output_file.write(
+                    render_row(
+                        writer, row_buffer, process_report(report, city_cache)
+                    )
+                )
+                num_processed += 1
+        output_size = output_file.tell()
+
+    os.replace(temp_output_path, output_path)
+    with open(state_path, "w") as state_file:
+        json.dump(
+            {
+                "fingerprint": fingerprint,
+                "report_hashes": new_report_hashes,
+                "row_offsets": row_offsets,
+                "output_size": output_size,
+            },
+            state_file,
         )
 
-        # Clean the state abbreviations.
-        report["state"] = (
-            clean_state(report["state"])
-            if report["state"]
-            else report["state"]
+    logger.info(
+        f"Processed {num_processed} new or changed reports out of "
+        f"{num_reports}."
+    )
+    return num_reports
+
+
+@click.command()
+@click.argument("raw_report_path", type=click.Path(exists=True))
+@click.argument("city_file", type=click.Path(exists=True))
+@click.option(
+    "--output-file",
+    "-o",
+    type=click.Path(dir_okay=False, writable=True),
+    default="output.csv",
+)
+@click.option(
+    "--workers",
+    "-w",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of worker processes to clean and geocode with.",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(["csv", "parquet"]),
+    default="csv",
+    help="Format of the output file.",
+)
+@click.option(
+    "--city-cache-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_CITY_CACHE_SIZE,
+    help="Number of distinct city / state pairs to keep cleaned and geocoded.",
+)
+@click.option(
+    "--fuzzy-threshold",
+    type=click.FloatRange(min=0.0, max=1.0),
+    default=None,
+    help=(
+        "Fall back to the most similar city in the state (trigram Dice "
+        "similarity) at or above this threshold, e.g. "
+        f"{fuzzy_geocoder.DEFAULT_FUZZY_THRESHOLD}."
+        " Off by default."
+    ),
+)
+@click.option(
+    "--engine",
+    type=click.Choice(["scalar", "vectorized"]),
+    default="scalar",
+    help="Clean reports one at a time or a column at a time with pandas.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="Only process reports that are new or changed since the last run.",
+)
+@click.option(
+    "--state-file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Report hashes from the last run. Defaults to OUTPUT_FILE.state.json",
+)
+@click.option(
+    "--profile",
+    "metrics_file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the run's time, rows and peak memory to this metrics JSON.",
+)
+@click.option(
+    "--profile-calls",
+    is_flag=True,
+    help=(
+        "Also time every JSON decode, date parse, city cleanup, geocode and "
+        "CSV row write. Slows the run down. Needs --profile and a single "
+        "worker."
+    ),
+)
+def main(
+    raw_report_path,
+    city_file,
+    output_file,
+    workers,
+    output_format,
+    city_cache_size,
+    fuzzy_threshold,
+    engine,
+    incremental,
+    state_file,
+    metrics_file,
+    profile_calls,
+):
+    """ Reads the raw scraped JSON reports and processes them into a CSV file
+        whilst performing data enrichment and cleaning. RAW_REPORT_PATH is a
+        line delimited JSON file or a report store directory.
+    """
+    input_paths = raw_report_paths(raw_report_path)
+    if incremental and workers > 1:
+        raise click.UsageError("--incremental can't be used with --workers.")
+    if incremental and output_format != "csv":
+        raise click.UsageError("--incremental only supports csv output.")
+    if engine == "vectorized" and (incremental or workers > 1):
+        raise click.UsageError(
+            "--engine vectorized can't be used with --incremental or "
+            "--workers."
+        )
+
+    # The per-call phases would be recorded in the forked processes, so with
+    # workers only the whole run is timed.
+    profiler = Profiler(
+        "process_report_data",
+        per_call=bool(metrics_file) and profile_calls and workers == 1,
+    )
+
+    fuzzy_matcher = (
+        fuzzy_geocoder.FuzzyMatcher(
+            load_city_locations(city_file), fuzzy_threshold
         )
+        if fuzzy_threshold is not None
+        else None
+    )
+    if fuzzy_matcher:
+        fuzzy_matcher.match = profiler.timed(
+            "fuzzy_match", fuzzy_matcher.match
+        )
+
+    # Processed rows are only reusable if the cities, the cleaning code and
+    # the fuzzy matching are the same as the last run.
+    fingerprint = (
+        file_hash(city_file)
+        + file_hash(__file__)
+        + file_hash(fuzzy_geocoder.__file__)
+        + str(fuzzy_threshold)
+        if incremental
+        else None
+    )
 
-        # Clean the city.
-        report["city"] = (
-            clean_city(report["city"], report["state"])
-            if report["city"] and report["state"]
-            else report["city"]
+    # Create the geocoder function and the cache in front of it.
+    with profiler.phase("load_geocoder"):
+        geocode = load_geocoder(city_file)
+    geocode = profiler.timed("geocode", geocode)
+
+    if engine == "vectorized":
+        # Imported here because it imports from this script.
+        from vectorized_cleaning import (
+            iter_report_dicts,
+            iter_report_tables,
+            write_report_tables,
         )
 
-        # Geocode the report.
-        if report["state"] and report["city"]:
-            city_lat, city_lon = geocode(report["state"], report["city"])
-            report["city_latitude"] = city_lat
-            report["city_longitude"] = city_lon
+        stats = Counter(fuzzy_matches=0)
+        report_tables = profiler.counted_batches(
+            iter_report_tables(
+                input_paths, geocode, fuzzy_matcher=fuzzy_matcher, stats=stats
+            )
+        )
+        with profiler.phase("process_reports"):
+            if output_format == "parquet":
+                write_parquet(iter_report_dicts(report_tables), output_file)
+            else:
+                with open(output_file, "wb") as output:
+                    write_report_tables(report_tables, output)
+        if fuzzy_matcher:
+            logger.info(
+                f"Fuzzy matching recovered {stats['fuzzy_matches']} reports."
+            )
+        profiler.write(metrics_file)
+        return
+
+    city_cache = CityCache(
+        geocode,
+        city_cache_size,
+        fuzzy_matcher,
+        profiler.timed("clean_city", clean_city),
+    )
+
+    if incremental:
+        with profiler.phase("process_reports"):
+            num_reports = process_incremental(
+                input_paths,
+                city_cache,
+                output_file,
+                state_file or f"{output_file}.state.json",
+                fingerprint,
+            )
+        profiler.add_rows(num_reports)
+        city_cache.log_stats()
+        profiler.write(metrics_file)
+        return
+
+    if output_format == "parquet":
+        with profiler.phase("process_reports"):
+            write_parquet(
+                profiler.counted(
+                    iter_processed_reports(input_paths, city_cache, workers)
+                ),
+                output_file,
+            )
+        city_cache.log_stats()
+        profiler.write(metrics_file)
+        return
+
+    with profiler.phase("process_reports"), open(output_file, "w") as output:
+        writer = DictWriter(output, fieldnames=FIELDNAMES)
+        writer.writeheader()
+
+        if workers == 1:
+            decode = profiler.timed("json_decode", decode_report)
+            process = profiler.timed("process_report", process_report)
+            standardize = profiler.timed("parse_dates", standardize_date_time)
+            write_row = profiler.timed("write_csv", writer.writerow)
+            for report_str in profiler.counted(iter_raw_reports(input_paths)):
+                write_row(
+                    process(decode(report_str), city_cache, standardize)
+                )
         else:
-            report["city_latitude"] = None
-            report["city_longitude"] = None
+            # Render the CSV in the workers. imap preserves the order of the
+            # chunks, so the output rows come out in the same order as the
+            # input.
+            with make_pool(city_cache, workers) as pool:
+                for rows, stats in pool.imap(
+                    _process_chunk, make_chunks(input_paths, workers)
+                ):
+                    profiler.add_rows(stats.pop("reports"))
+                    city_cache.stats.update(stats)
+                    output.write(rows)
 
-        writer.writerow(report)
+    city_cache.log_stats()
+    profiler.write(metrics_file)
 
 
 if __name__ == "__main__":
     main()  # Click injects the arguments.
-
@@ -0,0 +1,162 @@
+import json
+import os
+import resource
+
+from contextlib import contextmanager
+from functools import wraps
+from loguru import logger
+from time import perf_counter
+
+
+def _rows_of_first_argument(*args, **kwargs):
+    return len(args[0])
+
+
+class Profiler:
+    """ Collects the wall time and row counts of a script's phases, and the
+        peak memory of the run, and writes them as a metrics JSON file that
+        DVC can track.
+
+        Phases are timed either around a block of code with phase(), or per
+        call by wrapping a function with timed(). Per call phases count one
+        row per call unless told otherwise. Phases can nest, so their times
+        don't have to add up to the total.
+
+        The block phases and the totals are always collected, they cost next
+        to nothing. Per call timing is only on with per_call, otherwise
+        timed() returns the function as is.
+    """
+
+    def __init__(self, stage, per_call=False):
+        self.stage = stage
+        self.per_call = per_call
+        self.start = perf_counter()
+        self.rows = 0
+        # Phase name => {"seconds", "calls", "rows"}, in first seen order.
+        self.phases = {}
+
+    def _record(self, name, seconds, rows):
+        phase = self.phases.setdefault(
+            name, {"seconds": 0.0, "calls": 0, "rows": 0}
+        )
+        phase["seconds"] += seconds
+        phase["calls"] += 1
+        phase["rows"] += rows
+
+    @contextmanager
+    def phase(self, name, rows=0):
+        """ Times the block as the named phase.
+        """
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, perf_counter() - start, rows)
+
+    def timed(self, name, function, rows_of=None):
+        """ Wraps the function so every call is timed as the named phase.
+            rows_of(*args, **kwargs) gives the rows for a call, e.g.
+            rows_of="len" for functions that take a batch.
+        """
+        if not self.per_call:
+            return function
+        if rows_of == "len":
+            rows_of = _rows_of_first_argument
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._record(
+                    name,
+                    perf_counter() - start,
+                    rows_of(*args, **kwargs) if rows_of else 1,
+                )
+
+        return timed_function
+
+    def add_rows(self, rows):
+        """ Counts rows towards the run's overall throughput.
+        """
+        self.rows += rows
+
+    def counted(self, rows):
+        """ Passes the rows through, counting them towards the run's overall
+            throughput.
+        """
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    def counted_batches(self, batches):
+        """ Passes the batches through, counting their rows towards the run's
+            overall throughput.
+        """
+        for batch in batches:
+            self.rows += len(batch)
+            yield batch
+
+    def metrics(self):
+        total_seconds = perf_counter() - self.start
+        # ru_maxrss is in kilobytes on Linux.
+        peak_rss_mb = (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        )
+        peak_children_rss_mb = (
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        )
+        return {
+            "stage": self.stage,
+            "seconds": round(total_seconds, 4),
+            "rows": self.rows,
+            "rows_per_second": (
+                round(self.rows / total_seconds, 1) if total_seconds else 0.0
+            ),
+            "peak_rss_mb": round(peak_rss_mb, 1),
+            "peak_children_rss_mb": round(peak_children_rss_mb, 1),
+            "phases": {
+                name: {
+                    "seconds": round(phase["seconds"], 4),
+                    "calls": phase["calls"],
+                    "rows": phase["rows"],
+                    "rows_per_second": (
+                        round(phase["rows"] / phase["seconds"], 1)
+                        if phase["seconds"]
+                        else 0.0
+                    ),
+                    "share": (
+                        round(phase["seconds"] / total_seconds, 4)
+                        if total_seconds
+                        else 0.0
+                    ),
+                }
+                for name, phase in self.phases.items()
+            },
+        }
+
+    def write(self, metrics_path):
+        """ Writes the metrics JSON and logs a summary of the phases. Does
+            nothing without a metrics path.
+        """
+        if not metrics_path:
+            return
+        metrics = self.metrics()
+        metrics_dir = os.path.dirname(metrics_path)
+        if metrics_dir:
+            os.makedirs(metrics_dir, exist_ok=True)
+        with open(metrics_path, "w") as metrics_file:
+            json.dump(metrics, metrics_file, indent=2)
+
+        logger.info(
+            f"{self.stage}: {metrics['rows']} rows in "
+            f"{metrics['seconds']:.2f}s ({metrics['rows_per_second']:,.0f} "
+            f"rows/s), peak RSS {metrics['peak_rss_mb']:,.0f} MB."
+        )
+        for name, phase in metrics["phases"].items():
+            logger.info(
+                f"  {name}: {phase['seconds']:.2f}s "
+                f"({phase['share']:.1%}), {phase['rows']} rows"
+            )
+        logger.info(f"Wrote the profile to {metrics_path}.")
@@ -0,0 +1,253 @@
+import click
+import hashlib
+import json
+import os
+import shutil
+
+from collections import defaultdict
+from datetime import datetime
+from loguru import logger
+
+# The raw report store is a directory of line delimited JSON segments, one per
+# month the reports were posted, plus an index of report link => segment and
+# content hash. New reports are appended to their segment. Only segments with
+# a changed report are rewritten.
+SEGMENT_DIR = "segments"
+INDEX_FILE = "index.json"
+UNKNOWN_SEGMENT = "unknown"
+
+
+def segment_name(report):
+    """ The segment for a report, YYYY-MM of the posted date.
+    """
+    try:
+        posted = datetime.strptime(report["posted"], "%m/%d/%y")
+    except (TypeError, ValueError):
+        return UNKNOWN_SEGMENT
+    return posted.strftime("%Y-%m")
+
+
+def segment_path(store_dir, segment):
+    return os.path.join(store_dir, SEGMENT_DIR, f"{segment}.jsonl")
+
+
+def segment_paths(store_dir):
+    """ The paths of all the segments in the store, in name order.
+    """
+    segment_dir = os.path.join(store_dir, SEGMENT_DIR)
+    if not os.path.isdir(segment_dir):
+        return []
+    return [
+        os.path.join(segment_dir, name)
+        for name in sorted(os.listdir(segment_dir))
+        if name.endswith(".jsonl")
+    ]
+
+
+def report_hash(report_str):
+    return hashlib.blake2b(
+        report_str.encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def load_index(store_dir):
+    """ Loads the index of report link => [segment, content hash].
+    """
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, "r") as index_file:
+        return json.load(index_file)
+
+
+def save_index(store_dir, index):
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    with open(f"{index_path}.tmp", "w") as index_file:
+        json.dump(index, index_file)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
+def rewrite_segment(store_dir, segment, replacements, removals):
+    """ Rewrites a segment, replacing the reports in replacements
+        (link => report string) and dropping the links in removals.
+    """
+    path = segment_path(store_dir, segment)
+    with open(path, "r") as segment_file, open(
+        f"{path}.tmp", "w"
+    ) as new_segment_file:
+        for report_str in segment_file:
+            report_link = json.loads(report_str)["report_link"]
+            if report_link in removals:
+                continue
+            if report_link in replacements:
+                report_str = replacements[report_link] + "\n"
+            new_segment_file.write(report_str)
+    os.replace(f"{path}.tmp", path)
+
+
+def unindexed_reports(store_dir, segment, index):
+    """ The reports in a segment that the index doesn't place there, link =>
+        content hash. An append that stopped before the index was saved
+        leaves these behind.
+    """
+    path = segment_path(store_dir, segment)
+    if not os.path.exists(path):
+        return {}
+    unindexed = {}
+    with open(path, "r") as segment_file:
+        for report_str in segment_file:
+            report_link = json.loads(report_str)["report_link"]
+            if index.get(report_link, [None])[0] != segment:
+                unindexed[report_link] = report_hash(report_str.rstrip("\n"))
+    return unindexed
+
+
+def promote_index_state(index_state):
+    """ Moves the spider's pending index page validators into the index state
+        now that the reports from its crawl are stored. The pending file is
+        copied, not moved, as it's the crawl stage's output.
+    """
+    pending_path = f"{index_state}.pending"
+    if os.path.exists(pending_path):
+        shutil.copyfile(pending_path, f"{index_state}.tmp")
+    elif not os.path.exists(index_state):
+        with open(f"{index_state}.tmp", "w") as index_state_file:
+            json.dump({}, index_state_file)
+    else:
+        return
+    os.replace(f"{index_state}.tmp", index_state)
+
+
+@click.group()
+def cli():
+    """ Manages the append only raw report store.
+    """
+
+
+@cli.command()
+@click.argument("new_report_file", type=click.File("r"))
+@click.argument("store_dir", type=click.Path(file_okay=False))
+@click.option(
+    "--index-state",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help=(
+        "The spider's index page validators. The ones the crawl left in "
+        "INDEX_STATE.pending replace it once the reports are stored."
+    ),
+)
+def append(new_report_file, store_dir, index_state):
+    """ Adds the reports in NEW_REPORT_FILE to the store. New reports are
+        appended to their segment. Reports that were already in the store are
+        replaced if their content changed, which rewrites only their segment.
+    """
+    os.makedirs(os.path.join(store_dir, SEGMENT_DIR), exist_ok=True)
+    index = load_index(store_dir)
+    logger.info(f"Loaded index of {len(index)} reports from {store_dir}.")
+
+    # Segment => link => report string.
+    appends = defaultdict(dict)
+    replacements = defaultdict(dict)
+    removals = defaultdict(set)
+    # Link => [segment, content hash], applied to the index at the end.
+    updates = {}
+    seen_links = set()
+    num_new = 0
+    num_changed = 0
+    num_unchanged = 0
+    num_recovered = 0
+
+    for report in map(json.loads, new_report_file):
+        report_link = report["report_link"]
+        # The first copy of a report in the new file wins.
+        if report_link in seen_links:
+            continue
+        seen_links.add(report_link)
+
+        report_str = json.dumps(report)
+        content_hash = report_hash(report_str)
+        segment = segment_name(report)
+        old_segment, old_hash = index.get(report_link, (None, None))
+
+        if old_hash == content_hash:
+            num_unchanged += 1
+            continue
+        if old_segment is None:
+            num_new += 1
+        else:
+            num_changed += 1
+        if old_segment == segment:
+            replacements[segment][report_link] = report_str
+        else:
+            # A new report, or one whose posted date moved it to a different
+            # segment.
+            if old_segment is not None:
+                removals[old_segment].add(report_link)
+            appends[segment][report_link] = report_str
+        updates[report_link] = [segment, content_hash]
+
+    # Reports already in a segment from an append that didn't get as far as
+    # saving the index aren't appended again. They're replaced if they
+    # changed since, and indexed where they are if they're not in this
+    # batch.
+    for segment, segment_appends in appends.items():
+        unindexed = unindexed_reports(store_dir, segment, index)
+        for report_link, content_hash in unindexed.items():
+            num_recovered += 1
+            report_str = segment_appends.pop(report_link, None)
+            if report_str is not None:
+                if report_hash(report_str) != content_hash:
+                    replacements[segment][report_link] = report_str
+            elif report_link in updates:
+                removals[segment].add(report_link)
+            else:
+                if report_link in index:
+                    removals[index[report_link][0]].add(report_link)
+                updates[report_link] = [segment, content_hash]
+
+    for segment in sorted(set(replacements) | set(removals)):
+        rewrite_segment(
+            store_dir, segment, replacements[segment], removals[segment]
+        )
+
+    for segment, segment_appends in sorted(appends.items()):
+        with open(segment_path(store_dir, segment), "a") as segment_file:
+            for report_str in segment_appends.values():
+                segment_file.write(report_str + "\n")
+
+    # Saved last, an interrupted append is picked up by the next one.
+    index.update(updates)
+    save_index(store_dir, index)
+    if index_state:
+        promote_index_state(index_state)
+
+    # Changed reports that moved segment are appended to their new one, but
+    # they're still replacements.
+    num_moved = sum(map(len, removals.values()))
+    logger.info(
+        f"Appended {num_new} new reports, replaced {num_changed} changed "
+        f"reports ({num_moved} of them moved segment) and skipped "
+        f"{num_unchanged} unchanged reports."
+    )
+    if num_recovered:
+        logger.info(
+            f"Recovered {num_recovered} reports left unindexed by an "
+            "interrupted append."
+        )
+    logger.info(" 🛸 Done 🛸 ")
+
+
+@cli.command()
+@click.argument("store_dir", type=click.Path(exists=True, file_okay=False))
+@click.argument("output_file", type=click.File("w"))
+def export(store_dir, output_file):
+    """ Writes every report in the store to a single line delimited JSON file.
+    """
+    for path in segment_paths(store_dir):
+        with open(path, "r") as segment_file:
+            for report_str in segment_file:
+                output_file.write(report_str)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,8 +1,32 @@
 import click
+import hashlib
 import json
 
 from loguru import logger
-from toolz import pluck
+
+
+def link_key(report_link):
+    """ Compact fixed size key for a report link. 16 bytes of blake2b, so
+        collisions aren't a practical concern.
+    """
+    return hashlib.blake2b(
+        report_link.encode("utf-8"), digest_size=16
+    ).digest()
+
+
+def write_new_reports(report_file, merged_file, seen_links):
+    """ Streams the reports from report_file into merged_file, skipping any
+        with a link that's already been written. Returns the number written.
+    """
+    num_written = 0
+    for report in map(json.loads, report_file):
+        key = link_key(report["report_link"])
+        if key in seen_links:
+            continue
+        seen_links.add(key)
+        merged_file.write(json.dumps(report) + "\n")
+        num_written += 1
+    return num_written
 
 
 @click.command()
@@ -10,24 +34,22 @@ from toolz import pluck
 @click.argument("updated_file", type=click.File("r"))
 @click.argument("merged_file", type=click.File("w"))
 def main(orig_file, updated_file, merged_file):
+    # Only the hashes of the links that have been written are held in memory,
+    # the reports themselves are streamed straight through.
+    seen_links = set()
 
-    logger.info(f"Loading updated reports from {updated_file.name}.")
-    all_reports = list(map(json.loads, updated_file))
-    all_report_links = set(pluck("report_link", all_reports))
-    logger.info(f"Loaded {len(all_reports)} reports from {updated_file.name}.")
+    logger.info(f"Writing updated reports from {updated_file.name}.")
+    num_updated = write_new_reports(updated_file, merged_file, seen_links)
+    logger.info(f"Wrote {num_updated} reports from {updated_file.name}.")
 
     logger.info(
         f"Gathering old reports from {orig_file.name} to add any older "
         "missing reports."
     )
-    for report in map(json.loads, orig_file):
-        if report["report_link"] not in all_report_links:
-            all_reports.append(report)
-            all_report_links.update(report["report_link"])
-
-    logger.info(f"Writing {len(all_reports)} to {merged_file.name}.")
-    for report in map(json.dumps, all_reports):
-        merged_file.write(report + "\n")
+    num_orig = write_new_reports(orig_file, merged_file, seen_links)
+    logger.info(f"Wrote {num_orig} older reports from {orig_file.name}.")
+
+    logger.info(f"Wrote {num_updated + num_orig} to {merged_file.name}.")
     logger.info(" 🛸 Done 🛸 ")
 
 
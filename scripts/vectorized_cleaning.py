@@ -0,0 +1,244 @@
+import io
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pa_json
+
+from itertools import islice
+
+from process_report_data import (
+    FIELDNAMES,
+    clean_and_geocode_city,
+    clean_shape,
+    clean_state,
+    standardize_date_time,
+)
+
+# The column at a time engine. Arrow parses the raw JSON lines and renders
+# the CSV, which is where most of the time goes, and the columns are only
+# turned into Python objects for the cleaning. The cleaning functions from
+# process_report_data.py run once per distinct value of each column instead
+# of once per report. The report columns repeat heavily, so that's a lot
+# less work, and the cleaning rules only live in one place. Everything else
+# is passed straight through as Arrow strings.
+
+# Every raw report field is a string. Missing fields are null.
+RAW_REPORT_SCHEMA = pa.schema(
+    [
+        (name, pa.string())
+        for name in FIELDNAMES
+        if name not in ("city_latitude", "city_longitude")
+    ]
+)
+
+# Large enough for any one report, Arrow can't parse a line that's bigger
+# than a block.
+JSON_BLOCK_SIZE = 1 << 24
+
+# Fields the csv module quotes with QUOTE_MINIMAL and a \r\n line terminator.
+CSV_QUOTE_RE = r'[,"\r\n]'
+
+
+def read_report_table(report_lines):
+    """ Parses a batch of raw JSON report lines (bytes) into a table.
+    """
+    return pa_json.read_json(
+        io.BytesIO(b"".join(report_lines)),
+        read_options=pa_json.ReadOptions(block_size=JSON_BLOCK_SIZE),
+        parse_options=pa_json.ParseOptions(
+            explicit_schema=RAW_REPORT_SCHEMA,
+            unexpected_field_behavior="ignore",
+        ),
+    )
+
+
+def combined(values):
+    """ The column as a single array.
+    """
+    if isinstance(values, pa.ChunkedArray):
+        return values.combine_chunks()
+    return values
+
+
+def map_unique(values, transform, value_type=pa.string()):
+    """ Applies transform to the distinct non-null values of a column and
+        broadcasts the results back. Nulls stay null.
+    """
+    encoded = combined(values).dictionary_encode()
+    transformed = pa.array(
+        [transform(value) for value in encoded.dictionary.to_pylist()],
+        type=value_type,
+    )
+    return transformed.take(encoded.indices)
+
+
+def is_present(values):
+    """ Mask of the values that are truthy, i.e. not null or empty.
+    """
+    return pc.fill_null(pc.not_equal(values, ""), False)
+
+
+def clean_present(clean):
+    """ Wraps a cleaning function so empty values are left as they are.
+    """
+    return lambda value: clean(value) if value else value
+
+
+def clean_and_geocode_cities(
+    cities, states, geocode, fuzzy_matcher=None, stats=None
+):
+    """ Cleans and geocodes the cities, once per distinct city / state pair.
+        The states must already be cleaned. Rows without a city and a state
+        keep their city and have no location. Returns the cities, latitudes
+        and longitudes. The number of reports located by the fuzzy matcher
+        is added to stats.
+    """
+    cities = combined(cities).dictionary_encode()
+    states = combined(states).dictionary_encode()
+    present = pc.fill_null(
+        pc.and_(
+            is_present(cities.dictionary).take(cities.indices),
+            is_present(states.dictionary).take(states.indices),
+        ),
+        False,
+    )
+
+    # One integer key per city / state pair, null if either is missing.
+    num_states = len(states.dictionary)
+    pair_keys = pc.add(
+        pc.multiply(cities.indices.cast(pa.int64()), num_states),
+        states.indices.cast(pa.int64()),
+    )
+    pairs = pc.if_else(present, pair_keys, None).dictionary_encode()
+
+    city_names = cities.dictionary.to_pylist()
+    state_names = states.dictionary.to_pylist()
+    located = [
+        clean_and_geocode_city(
+            city_names[pair_key // num_states],
+            state_names[pair_key % num_states],
+            geocode,
+            fuzzy_matcher,
+        )
+        for pair_key in pairs.dictionary.to_pylist()
+    ]
+    new_cities, latitudes, longitudes, fuzzy = (
+        zip(*located) if located else ((), (), (), ())
+    )
+
+    if stats is not None:
+        fuzzy = pa.array(fuzzy, type=pa.bool_()).take(pairs.indices)
+        stats["fuzzy_matches"] += pc.sum(fuzzy).as_py() or 0
+
+    return (
+        pc.if_else(
+            present,
+            pa.array(new_cities, type=pa.string()).take(pairs.indices),
+            cities.dictionary.take(cities.indices),
+        ),
+        pa.array(latitudes, type=pa.float64()).take(pairs.indices),
+        pa.array(longitudes, type=pa.float64()).take(pairs.indices),
+    )
+
+
+def process_report_table(reports, geocode, fuzzy_matcher=None, stats=None):
+    """ Cleans and geocodes a table of raw reports. Returns a table with the
+        output columns.
+    """
+    # Standardize the dates into isoformat. If either fails to parse, both
+    # are null.
+    posted = map_unique(reports["posted"], standardize_date_time)
+    date_time = map_unique(reports["date_time"], standardize_date_time)
+    parsed = pc.and_(pc.is_valid(posted), pc.is_valid(date_time))
+    no_date = pa.scalar(None, type=pa.string())
+
+    state = map_unique(reports["state"], clean_present(clean_state))
+    city, city_latitude, city_longitude = clean_and_geocode_cities(
+        reports["city"], state, geocode, fuzzy_matcher, stats
+    )
+
+    columns = {
+        **{name: reports[name] for name in reports.column_names},
+        "posted": pc.if_else(parsed, posted, no_date),
+        "date_time": pc.if_else(parsed, date_time, no_date),
+        "shape": map_unique(reports["shape"], clean_present(clean_shape)),
+        "state": state,
+        "city": city,
+        "city_latitude": city_latitude,
+        "city_longitude": city_longitude,
+    }
+    return pa.table([columns[name] for name in FIELDNAMES], names=FIELDNAMES)
+
+
+def iter_report_tables(
+    raw_report_paths,
+    geocode,
+    batch_size=10000,
+    fuzzy_matcher=None,
+    stats=None,
+):
+    """ Yields processed tables of reports from the raw report files, in
+        batches of batch_size lines.
+    """
+    for raw_report_path in raw_report_paths:
+        with open(raw_report_path, "rb") as raw_report_file:
+            while True:
+                report_lines = list(islice(raw_report_file, batch_size))
+                if not report_lines:
+                    break
+                yield process_report_table(
+                    read_report_table(report_lines),
+                    geocode,
+                    fuzzy_matcher,
+                    stats,
+                )
+
+
+def csv_fields(values):
+    """ Renders a column as CSV fields the way the csv module does. Fields
+        are quoted only if they need to be, nulls are empty and floats are
+        their repr.
+    """
+    if pa.types.is_floating(values.type):
+        values = map_unique(values, repr)
+    quoted = pc.binary_join_element_wise(
+        '"', pc.replace_substring(values, '"', '""'), '"', ""
+    )
+    fields = pc.if_else(
+        pc.match_substring_regex(values, CSV_QUOTE_RE), quoted, values
+    )
+    return pc.fill_null(fields, "")
+
+
+def write_report_tables(report_tables, output_file):
+    """ Writes the processed tables to a CSV file opened in binary mode,
+        header included. The output is the same as csv.DictWriter's.
+    """
+    output_file.write((",".join(FIELDNAMES) + "\r\n").encode("utf-8"))
+    for report_table in report_tables:
+        lines = pc.binary_join_element_wise(
+            pc.binary_join_element_wise(
+                *[csv_fields(report_table[name]) for name in FIELDNAMES], ","
+            ),
+            "\r\n",
+            "",
+        )
+        # The rendered lines are back to back in the chunk's data buffer.
+        for chunk in getattr(lines, "chunks", [lines]):
+            if not len(chunk):
+                continue
+            offsets = np.frombuffer(
+                chunk.buffers()[1],
+                dtype=np.int32,
+                count=len(chunk) + 1,
+                offset=chunk.offset * 4,
+            )
+            start, end = int(offsets[0]), int(offsets[-1])
+            output_file.write(chunk.buffers()[2].slice(start, end - start))
+
+
+def iter_report_dicts(report_tables):
+    """ Yields the processed reports from the tables as dicts.
+    """
+    for report_table in report_tables:
+        yield from report_table.to_pylist()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(__file__), os.pardir)
+
+# The scripts import each other as top level modules, and the scrapy project
+# is run from its own directory.
+sys.path.insert(0, os.path.join(ROOT_DIR, "scripts"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "nuforc_reports"))
@@ -0,0 +1,169 @@
+import io
+import json
+import os
+import pytest
+
+from csv import DictWriter
+from process_report_data import (
+    FIELDNAMES,
+    CityCache,
+    load_geocoder,
+    process_report,
+)
+from vectorized_cleaning import (
+    iter_report_dicts,
+    iter_report_tables,
+    write_report_tables,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+# Edge cases for every cleaning rule: city prefix and whitespace variants,
+# the spot corrections, both date forms, future years, "now" / "today",
+# missing values and fields the CSV has to quote.
+REPORT_FILE = os.path.join(DATA_DIR, "reports.jsonl")
+CITY_FILE = os.path.join(DATA_DIR, "cities.csv")
+
+
+@pytest.fixture(scope="module")
+def geocode():
+    return load_geocoder(CITY_FILE)
+
+
+@pytest.fixture(scope="module")
+def scalar_reports(geocode):
+    city_cache = CityCache(geocode)
+    with open(REPORT_FILE, "r") as report_file:
+        return [
+            process_report(json.loads(report_str), city_cache)
+            for report_str in report_file
+        ]
+
+
+def test_vectorized_csv_matches_scalar(geocode, scalar_reports):
+    scalar_output = io.StringIO()
+    writer = DictWriter(scalar_output, fieldnames=FIELDNAMES)
+    writer.writeheader()
+    writer.writerows(scalar_reports)
+
+    # Small batches so values repeat within and across batches.
+    vectorized_output = io.BytesIO()
+    write_report_tables(
+        iter_report_tables([REPORT_FILE], geocode, batch_size=7),
+        vectorized_output,
+    )
+
+    assert vectorized_output.getvalue().decode("utf-8") == (
+        scalar_output.getvalue()
+    )
+
+
+def test_vectorized_reports_match_scalar(geocode, scalar_reports):
+    vectorized_reports = list(
+        iter_report_dicts(iter_report_tables([REPORT_FILE], geocode))
+    )
+
+    assert vectorized_reports == [
+        {name: report[name] for name in FIELDNAMES}
+        for report in scalar_reports
+    ]
+
+
+def test_vectorized_counts_fuzzy_matches_per_report(geocode):
+    class FuzzyMatcher:
+        def match(self, state, city):
+            return (1.0, 2.0) if city == "Nowhere" else (None, None)
+
+    stats = {"fuzzy_matches": 0}
+    list(
+        iter_report_tables(
+            [REPORT_FILE], geocode, fuzzy_matcher=FuzzyMatcher(), stats=stats
+        )
+    )
+
+    assert stats["fuzzy_matches"] == 1
+
+
+BASE_REPORT = {
+    "summary": "Bright light",
+    "country": "USA",
+    "city": "Austin",
+    "state": "TX",
+    "date_time": "6/1/21 20:00",
+    "shape": "Light",
+    "duration": "5 minutes",
+    "stats": "Occurred : 6/1/21 20:00",
+    "report_link": "http://www.nuforc.org/webreports/000.html",
+    "text": "A bright light.",
+    "posted": "6/4/21",
+}
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        # The long and short date forms.
+        (
+            {},
+            {
+                "date_time": "2021-06-01T20:00:00",
+                "posted": "2021-06-04T00:00:00",
+            },
+        ),
+        ({"date_time": "6/1/21"}, {"date_time": "2021-06-01T00:00:00"}),
+        ({"date_time": "6/1/21 9:5"}, {"date_time": "2021-06-01T09:05:00"}),
+        # Future two digit years are last century.
+        (
+            {"date_time": "6/1/50 20:00", "posted": "6/4/50"},
+            {
+                "date_time": "1950-06-01T20:00:00",
+                "posted": "1950-06-04T00:00:00",
+            },
+        ),
+        ({"date_time": "1/1/69"}, {"date_time": "1969-01-01T00:00:00"}),
+        # Unparseable dates null both dates.
+        ({"date_time": "now"}, {"date_time": None, "posted": None}),
+        ({"posted": "today"}, {"date_time": None, "posted": None}),
+        ({"date_time": "2/30/21"}, {"date_time": None, "posted": None}),
+        ({"shape": "Triangular"}, {"shape": "triangle"}),
+        ({"shape": ""}, {"shape": ""}),
+        ({"state": "nf"}, {"state": "NL"}),
+        ({"state": "pq"}, {"state": "QC"}),
+        (
+            {"city": "Ft. Worth"},
+            {"city": "Fort Worth", "city_latitude": 32.7555},
+        ),
+        ({"city": " ft. Worth"}, {"city": "Fort Worth"}),
+        ({"city": "Mt. Vernon", "state": "NY"}, {"city": "Mount Vernon"}),
+        ({"city": "ST. Paul", "state": "MN"}, {"city": "Saint Paul"}),
+        (
+            {"city": "Austin (west)/Lakeway"},
+            {"city": "Austin", "city_latitude": 30.2672},
+        ),
+        ({"city": "Austin", "state": ""}, {"city": "Austin", "state": ""}),
+        (
+            {"city": "new york city", "state": "NY"},
+            {"city": "New York", "city_latitude": 40.7128},
+        ),
+        ({"city": "Washington, D.C.", "state": "DC"}, {"city": "Washington"}),
+        ({"city": "St. Louis", "state": "MO"}, {"city": "St Louis"}),
+        (
+            {"city": "St. Louis", "state": "MI"},
+            {"city": "Saint Louis", "city_latitude": None},
+        ),
+        (
+            {"city": "Saint Petersburg", "state": "FL"},
+            {"city": "St. Petersburg"},
+        ),
+        (
+            {"city": "Port St. Lucie", "state": "FL"},
+            {"city": "Port Saint Lucie"},
+        ),
+        (
+            {"city": "St. Peters", "state": "MO"},
+            {"city": "City of Saint Peters"},
+        ),
+    ],
+)
+def test_cleaning_rules(geocode, raw, expected):
+    report = process_report({**BASE_REPORT, **raw}, CityCache(geocode))
+    assert {name: report[name] for name in expected} == expected
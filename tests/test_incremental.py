@@ -0,0 +1,192 @@
+import json
+import os
+import process_report_data
+import pytest
+
+from csv import DictWriter
+from process_report_data import (
+    FIELDNAMES,
+    CityCache,
+    load_geocoder,
+    process_incremental,
+    process_report,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+REPORT_FILE = os.path.join(DATA_DIR, "reports.jsonl")
+CITY_FILE = os.path.join(DATA_DIR, "cities.csv")
+
+
+@pytest.fixture(scope="module")
+def geocode():
+    return load_geocoder(CITY_FILE)
+
+
+@pytest.fixture
+def report_lines():
+    with open(REPORT_FILE, "r") as report_file:
+        return report_file.readlines()
+
+
+@pytest.fixture
+def processed_count(monkeypatch):
+    """ Counts the reports that process_incremental actually processes.
+    """
+    counts = {"processed": 0}
+
+    def counted_process_report(report, city_cache):
+        counts["processed"] += 1
+        return process_report(report, city_cache)
+
+    monkeypatch.setattr(
+        process_report_data, "process_report", counted_process_report
+    )
+    return counts
+
+
+def write_lines(path, lines):
+    with open(path, "w") as raw_file:
+        raw_file.writelines(lines)
+
+
+def full_run(raw_path, output_path, geocode):
+    """ The output of a full, non incremental run.
+    """
+    city_cache = CityCache(geocode)
+    with open(raw_path, "r") as raw_file, open(output_path, "w") as output:
+        writer = DictWriter(output, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for report_str in raw_file:
+            writer.writerow(process_report(json.loads(report_str), city_cache))
+    with open(output_path, "rb") as output:
+        return output.read()
+
+
+def incremental_run(raw_path, output_path, geocode, fingerprint="cities"):
+    return process_incremental(
+        [raw_path],
+        CityCache(geocode),
+        output_path,
+        f"{output_path}.state.json",
+        fingerprint,
+    )
+
+
+def read_bytes(path):
+    with open(path, "rb") as read_file:
+        return read_file.read()
+
+
+def test_first_run_matches_full_run(
+    tmp_path, geocode, report_lines, processed_count
+):
+    raw_path = tmp_path / "reports.jsonl"
+    write_lines(raw_path, report_lines)
+
+    num_reports = incremental_run(raw_path, tmp_path / "out.csv", geocode)
+
+    assert num_reports == len(report_lines)
+    assert processed_count["processed"] == len(report_lines)
+    assert read_bytes(tmp_path / "out.csv") == full_run(
+        raw_path, tmp_path / "full.csv", geocode
+    )
+
+
+def test_unchanged_rerun_leaves_output_alone(
+    tmp_path, geocode, report_lines, processed_count
+):
+    raw_path = tmp_path / "reports.jsonl"
+    output_path = tmp_path / "out.csv"
+    write_lines(raw_path, report_lines)
+    incremental_run(raw_path, output_path, geocode)
+    modified_time = os.stat(output_path).st_mtime_ns
+    state_modified_time = os.stat(f"{output_path}.state.json").st_mtime_ns
+    processed_count["processed"] = 0
+
+    incremental_run(raw_path, output_path, geocode)
+
+    assert processed_count["processed"] == 0
+    assert os.stat(output_path).st_mtime_ns == modified_time
+    assert (
+        os.stat(f"{output_path}.state.json").st_mtime_ns
+        == state_modified_time
+    )
+
+
+def test_changes_match_full_run(
+    tmp_path, geocode, report_lines, processed_count
+):
+    raw_path = tmp_path / "reports.jsonl"
+    output_path = tmp_path / "out.csv"
+    write_lines(raw_path, report_lines)
+    incremental_run(raw_path, output_path, geocode)
+    processed_count["processed"] = 0
+
+    changed = json.loads(report_lines[3])
+    changed["city"] = "Fort Worth"
+    new = {**json.loads(report_lines[0]), "report_link": "new", "state": "MO"}
+    # One report changed, one new, the first and last swapped (moved) and
+    # one removed.
+    new_lines = (
+        [report_lines[-1]]
+        + report_lines[1:3]
+        + [json.dumps(changed) + "\n"]
+        + report_lines[4:10]
+        + report_lines[11:-1]
+        + [json.dumps(new) + "\n", report_lines[0]]
+    )
+    write_lines(raw_path, new_lines)
+
+    num_reports = incremental_run(raw_path, output_path, geocode)
+
+    assert num_reports == len(new_lines)
+    assert processed_count["processed"] == 2
+    assert read_bytes(output_path) == full_run(
+        raw_path, tmp_path / "full.csv", geocode
+    )
+
+    # The recorded offsets still line up for the run after.
+    processed_count["processed"] = 0
+    write_lines(raw_path, new_lines[::-1])
+    incremental_run(raw_path, output_path, geocode)
+
+    assert processed_count["processed"] == 0
+    assert read_bytes(output_path) == full_run(
+        raw_path, tmp_path / "full.csv", geocode
+    )
+
+
+def test_fingerprint_change_rebuilds(
+    tmp_path, geocode, report_lines, processed_count
+):
+    raw_path = tmp_path / "reports.jsonl"
+    output_path = tmp_path / "out.csv"
+    write_lines(raw_path, report_lines)
+    incremental_run(raw_path, output_path, geocode)
+    processed_count["processed"] = 0
+
+    incremental_run(raw_path, output_path, geocode, fingerprint="new cities")
+
+    assert processed_count["processed"] == len(report_lines)
+    assert read_bytes(output_path) == full_run(
+        raw_path, tmp_path / "full.csv", geocode
+    )
+
+
+def test_changed_output_rebuilds(
+    tmp_path, geocode, report_lines, processed_count
+):
+    raw_path = tmp_path / "reports.jsonl"
+    output_path = tmp_path / "out.csv"
+    write_lines(raw_path, report_lines)
+    incremental_run(raw_path, output_path, geocode)
+    with open(output_path, "a") as output:
+        output.write("not,a,processed,row\r\n")
+    processed_count["processed"] = 0
+
+    incremental_run(raw_path, output_path, geocode)
+
+    assert processed_count["processed"] == len(report_lines)
+    assert read_bytes(output_path) == full_run(
+        raw_path, tmp_path / "full.csv", geocode
+    )
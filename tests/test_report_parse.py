@@ -0,0 +1,46 @@
+import glob
+import os
+import pytest
+
+from benchmark_report_parse import parse_report_area_xpath
+from nuforc_reports.spiders.nuforc_report_spider import parse_report_area
+from scrapy.http import HtmlResponse
+
+# Report pages in the layout of the NUFORC sighting pages: labels in bold,
+# empty values, nested tags in the labels, comments, entities and multi line
+# narratives.
+REPORT_PAGE_DIR = os.path.join(
+    os.path.dirname(__file__), "data", "report_pages"
+)
+REPORT_PAGES = sorted(glob.glob(os.path.join(REPORT_PAGE_DIR, "*.html")))
+
+
+def load_page(path):
+    with open(path, "rb") as page_file:
+        return HtmlResponse(
+            url=f"file://{path}", body=page_file.read(), encoding="utf-8"
+        )
+
+
+@pytest.mark.parametrize("path", REPORT_PAGES, ids=os.path.basename)
+def test_single_pass_matches_xpath_extraction(path):
+    response = load_page(path)
+
+    report_pairs, report_text = parse_report_area(response)
+    xpath_pairs, xpath_text, _ = parse_report_area_xpath(response)
+
+    assert report_pairs == xpath_pairs
+    assert report_text == xpath_text
+
+
+def test_report_fields():
+    report_pairs, report_text = parse_report_area(
+        load_page(os.path.join(REPORT_PAGE_DIR, "S176512.html"))
+    )
+
+    assert report_pairs[:3] == [
+        ("Occurred", "2023-06-01 20:00 Local"),
+        ("Reported", "2023-06-02 01:12 Pacific"),
+        ("Duration", "5 minutes"),
+    ]
+    assert "No sound at all." in report_text
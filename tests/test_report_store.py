@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+
+from click.testing import CliRunner
+from report_store import cli, load_index, segment_path
+
+
+def report(number, posted, text="A bright light."):
+    return {
+        "report_link": f"http://www.nuforc.org/webreports/{number:03d}.html",
+        "posted": posted,
+        "text": text,
+    }
+
+
+def append(tmp_path, store_dir, reports, *options):
+    new_report_path = tmp_path / "new_reports.json"
+    with open(new_report_path, "w") as new_report_file:
+        for report_ in reports:
+            new_report_file.write(json.dumps(report_) + "\n")
+    result = CliRunner().invoke(
+        cli, ["append", str(new_report_path), str(store_dir), *options]
+    )
+    assert result.exit_code == 0, result.output
+
+
+def read_segment(store_dir, segment):
+    with open(segment_path(store_dir, segment), "r") as segment_file:
+        return [json.loads(report_str) for report_str in segment_file]
+
+
+def read_segments(store_dir):
+    return {
+        name[: -len(".jsonl")]: read_segment(store_dir, name[: -len(".jsonl")])
+        for name in sorted(os.listdir(store_dir / "segments"))
+    }
+
+
+def test_new_reports_go_to_their_segment(tmp_path):
+    store_dir = tmp_path / "store"
+
+    append(
+        tmp_path,
+        store_dir,
+        [report(1, "6/4/21"), report(2, "7/1/21"), report(3, None)],
+    )
+    append(tmp_path, store_dir, [report(4, "6/30/21")])
+
+    assert read_segments(store_dir) == {
+        "2021-06": [report(1, "6/4/21"), report(4, "6/30/21")],
+        "2021-07": [report(2, "7/1/21")],
+        "unknown": [report(3, None)],
+    }
+    assert {
+        report_link: segment
+        for report_link, (segment, _) in load_index(store_dir).items()
+    } == {
+        report(1, "")["report_link"]: "2021-06",
+        report(2, "")["report_link"]: "2021-07",
+        report(3, "")["report_link"]: "unknown",
+        report(4, "")["report_link"]: "2021-06",
+    }
+
+
+def test_unchanged_reports_are_skipped(tmp_path):
+    store_dir = tmp_path / "store"
+    append(tmp_path, store_dir, [report(1, "6/4/21"), report(2, "7/1/21")])
+    modified_time = os.stat(segment_path(store_dir, "2021-06")).st_mtime_ns
+
+    append(tmp_path, store_dir, [report(1, "6/4/21"), report(3, "7/2/21")])
+
+    assert (
+        os.stat(segment_path(store_dir, "2021-06")).st_mtime_ns
+        == modified_time
+    )
+    assert read_segments(store_dir) == {
+        "2021-06": [report(1, "6/4/21")],
+        "2021-07": [report(2, "7/1/21"), report(3, "7/2/21")],
+    }
+
+
+def test_changed_reports_are_replaced_in_place(tmp_path):
+    store_dir = tmp_path / "store"
+    append(
+        tmp_path,
+        store_dir,
+        [report(1, "6/4/21"), report(2, "6/5/21"), report(3, "6/6/21")],
+    )
+
+    append(tmp_path, store_dir, [report(2, "6/5/21", "Two lights.")])
+
+    assert read_segments(store_dir) == {
+        "2021-06": [
+            report(1, "6/4/21"),
+            report(2, "6/5/21", "Two lights."),
+            report(3, "6/6/21"),
+        ],
+    }
+
+
+def test_changed_reports_move_segment(tmp_path):
+    store_dir = tmp_path / "store"
+    append(
+        tmp_path,
+        store_dir,
+        [report(1, "6/4/21"), report(2, "6/5/21"), report(3, "7/1/21")],
+    )
+
+    append(tmp_path, store_dir, [report(1, "7/2/21")])
+
+    assert read_segments(store_dir) == {
+        "2021-06": [report(2, "6/5/21")],
+        "2021-07": [report(3, "7/1/21"), report(1, "7/2/21")],
+    }
+    assert load_index(store_dir)[report(1, "")["report_link"]][0] == (
+        "2021-07"
+    )
+
+
+def test_first_copy_of_a_report_wins(tmp_path):
+    store_dir = tmp_path / "store"
+
+    append(
+        tmp_path,
+        store_dir,
+        [
+            report(1, "6/4/21"),
+            report(1, "6/4/21", "Two lights."),
+            report(1, "7/4/21"),
+        ],
+    )
+
+    assert read_segments(store_dir) == {"2021-06": [report(1, "6/4/21")]}
+
+
+def test_interrupted_append_is_not_repeated(tmp_path):
+    store_dir = tmp_path / "store"
+    append(tmp_path, store_dir, [report(1, "6/4/21")])
+    # Stop the next append after its segments are written but before its
+    # index is saved, by putting the old index back.
+    shutil.copy(store_dir / "index.json", tmp_path / "index.json")
+    append(
+        tmp_path,
+        store_dir,
+        [report(1, "7/1/21"), report(2, "6/5/21"), report(3, "7/2/21")],
+    )
+    shutil.copy(tmp_path / "index.json", store_dir / "index.json")
+
+    # Rerun with one of the reports changed since, and one left out.
+    append(
+        tmp_path,
+        store_dir,
+        [report(1, "7/1/21"), report(2, "6/5/21", "Two lights.")],
+    )
+
+    assert read_segments(store_dir) == {
+        "2021-06": [report(2, "6/5/21", "Two lights.")],
+        "2021-07": [report(1, "7/1/21"), report(3, "7/2/21")],
+    }
+    assert {
+        report_link: segment
+        for report_link, (segment, _) in load_index(store_dir).items()
+    } == {
+        report(1, "")["report_link"]: "2021-07",
+        report(2, "")["report_link"]: "2021-06",
+        report(3, "")["report_link"]: "2021-07",
+    }
+
+
+def test_pending_index_state_is_promoted(tmp_path):
+    store_dir = tmp_path / "store"
+    index_state = tmp_path / "index_state.json"
+
+    # No crawl has left validators yet.
+    append(tmp_path, store_dir, [], "--index-state", str(index_state))
+    with open(index_state, "r") as index_state_file:
+        assert json.load(index_state_file) == {}
+
+    validators = {"https://nuforc.org/subndx/?id=p20230601": {"etag": "1"}}
+    with open(f"{index_state}.pending", "w") as pending_file:
+        json.dump(validators, pending_file)
+    append(
+        tmp_path,
+        store_dir,
+        [report(1, "6/4/21")],
+        "--index-state",
+        str(index_state),
+    )
+
+    with open(index_state, "r") as index_state_file:
+        assert json.load(index_state_file) == validators
+    # The crawl's output stays where it is.
+    assert os.path.exists(f"{index_state}.pending")
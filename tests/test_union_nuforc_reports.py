@@ -0,0 +1,56 @@
+import json
+
+from click.testing import CliRunner
+from union_nuforc_reports import main
+
+
+def report(report_link, text):
+    return {"report_link": report_link, "text": text}
+
+
+def write_reports(path, reports):
+    with open(path, "w") as report_file:
+        for report_ in reports:
+            report_file.write(json.dumps(report_) + "\n")
+
+
+def test_updated_reports_win_and_duplicates_are_dropped(tmp_path):
+    write_reports(
+        tmp_path / "orig.json",
+        [
+            report("http://www.nuforc.org/webreports/001.html", "old 1"),
+            report("http://www.nuforc.org/webreports/002.html", "old 2"),
+            report("http://www.nuforc.org/webreports/001.html", "old 1 again"),
+            report("http://www.nuforc.org/webreports/003.html", "old 3"),
+            report("http://www.nuforc.org/webreports/003.html", "old 3 again"),
+        ],
+    )
+    write_reports(
+        tmp_path / "updated.json",
+        [
+            report("http://www.nuforc.org/webreports/002.html", "new 2"),
+            report("http://www.nuforc.org/webreports/004.html", "new 4"),
+            report("http://www.nuforc.org/webreports/002.html", "new 2 again"),
+        ],
+    )
+
+    result = CliRunner().invoke(
+        main,
+        [
+            str(tmp_path / "orig.json"),
+            str(tmp_path / "updated.json"),
+            str(tmp_path / "merged.json"),
+        ],
+    )
+
+    assert result.exit_code == 0, result.output
+    with open(tmp_path / "merged.json", "r") as merged_file:
+        merged = [json.loads(line) for line in merged_file]
+    # The updated reports come first, then the old reports that weren't
+    # updated. The first copy of a link wins.
+    assert merged == [
+        report("http://www.nuforc.org/webreports/002.html", "new 2"),
+        report("http://www.nuforc.org/webreports/004.html", "new 4"),
+        report("http://www.nuforc.org/webreports/001.html", "old 1"),
+        report("http://www.nuforc.org/webreports/003.html", "old 3"),
+    ]